@@ -1,7 +1,15 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Result_cache"))
+from result_cache import ResultCache, cache_key, code_version, write_npz
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Plotting"))
+from parallel_export import export_animation
+
 """4 cycle piston engine cycle simulation
 car model: BMW M8-competition
 engine model: BMW S63B44T4 V8 twin-turbo
@@ -18,7 +26,7 @@ class Piston:
     Temperature_ambient = 300 #K
     Pressure_boost = 1.7e5
 
-    def __init__(self, stroke_length: float, bore_length: float, compression_ratio: float, cycle_time: int, turbocharger: bool = True):
+    def __init__(self, stroke_length: float, bore_length: float, compression_ratio: float, cycle_time: float, turbocharger: bool = True):
         """Stroke/bore length - milimeters (mm); cycle time - miliseconds (ms)"""
         self.max_volume = stroke_length / 1e3 * np.pi * np.power(bore_length/2, 2) / 1e6
         self.volume_min = self.max_volume / compression_ratio
@@ -35,6 +43,14 @@ class Piston:
         self.temperature = self.Temperature_ambient
         self.quantity = self.max_quantity / compression_ratio
         self.time = 0
+        #position inside the current cycle (see cycle_operation), kept for checkpoints
+        self.cycle_step = 0
+
+        #constructor inputs, kept for checkpoints
+        self.stroke_length = stroke_length
+        self.bore_length = bore_length
+        self.compression_ratio = compression_ratio
+        self.turbocharger = turbocharger
 
         #initialise storage:
         self.volume_data = np.array([self.volume])
@@ -46,6 +62,7 @@ class Piston:
         self.pressure_data = np.array([self.pressure])
         self.temperature_data = np.array([self.temperature])
         self.time = 0
+        self.cycle_step = 0
 
     def update_piston_volume(self):
         """find the piston volume based on the crankshaft movement"""
@@ -96,34 +113,101 @@ class Piston:
 
         self.store_data()
 
-    def simulate_cycle(self, stroke_timesteps: int):
-        """Make a full engine cycle"""
-        time_interval: float = self.cycle_time / stroke_timesteps / 2.0
-
+    def cycle_operation(self, step: int, stroke_timesteps: int, time_interval: float):
+        """Run operation number `step` of a cycle (4 * stroke_timesteps + 2 operations in total)"""
         #intake stroke:
-        for i in range(stroke_timesteps):
+        if step < stroke_timesteps:
             self.intake_stroke_update(time_interval)
-
         #compression stroke:
-        for i in range(stroke_timesteps):
+        elif step < 2 * stroke_timesteps:
             self.compression_stroke_update(time_interval)
-
         #ignition
-        self.ignition()
+        elif step == 2 * stroke_timesteps:
+            self.ignition()
         #power/expansion stroke, same as compression stroke
-        for i in range(stroke_timesteps):
+        elif step <= 3 * stroke_timesteps:
             self.compression_stroke_update(time_interval)
-
         #cool and depresurise
-        self.depressurise()
+        elif step == 3 * stroke_timesteps + 1:
+            self.depressurise()
         #exhaust stroke(same as intake stroke)
-        for i in range(stroke_timesteps):
+        else:
             self.intake_stroke_update(time_interval)
 
-    def display_cycle(self, stroke_timesteps: int):
-        """Display the data in a pressure volume graph"""
+    def simulate_cycle(self, stroke_timesteps: int, checkpoint_path: str | None = None, checkpoint_every: int = 1000):
+        """Make a full engine cycle (continues from cycle_step after a resume)
+        With a checkpoint_path the state is saved every checkpoint_every operations"""
+        time_interval: float = self.cycle_time / stroke_timesteps / 2.0
+
+        while self.cycle_step < 4 * stroke_timesteps + 2:
+            self.cycle_operation(self.cycle_step, stroke_timesteps, time_interval)
+            self.cycle_step += 1
+
+            if checkpoint_path is not None and self.cycle_step % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint_path)
+
+        self.cycle_step = 0
+
+    def save_checkpoint(self, path: str):
+        """Save the full state (.npz, written atomically with write_npz)"""
+        state = {"stroke_length": self.stroke_length,
+                 "bore_length": self.bore_length,
+                 "compression_ratio": self.compression_ratio,
+                 "cycle_time": self.cycle_time,
+                 "turbocharger": self.turbocharger,
+                 "volume": self.volume,
+                 "pressure": self.pressure,
+                 "temperature": self.temperature,
+                 "quantity": self.quantity,
+                 "time": self.time,
+                 "cycle_step": self.cycle_step,
+                 "volume_data": self.volume_data,
+                 "pressure_data": self.pressure_data,
+                 "temperature_data": self.temperature_data}
+
+        write_npz(path, state)
+
+    @classmethod
+    def load_checkpoint(cls, path: str):
+        """Rebuild a Piston from save_checkpoint, continuing bit-identically
+        (call simulate_cycle with the same stroke_timesteps to finish the cycle)"""
+        data = np.load(path)
+
+        piston = cls(float(data["stroke_length"]), float(data["bore_length"]), float(data["compression_ratio"]),
+                     float(data["cycle_time"]), bool(data["turbocharger"]))
+        piston.volume = float(data["volume"])
+        piston.pressure = float(data["pressure"])
+        piston.temperature = float(data["temperature"])
+        piston.quantity = float(data["quantity"])
+        piston.time = float(data["time"])
+        piston.cycle_step = int(data["cycle_step"])
+        piston.volume_data = data["volume_data"]
+        piston.pressure_data = data["pressure_data"]
+        piston.temperature_data = data["temperature_data"]
+        return piston
+
+    def run_cycles(self, stroke_timesteps: int, cycles: int = 1, cache: ResultCache | None = None):
+        """Reset the storage and simulate full engine cycles
+        cache - reload the result of a previous run with the same state, inputs and code"""
         self.reset()
-        self.simulate_cycle(stroke_timesteps)
+
+        key = cache_key(self.stroke_length, self.bore_length, self.compression_ratio, self.cycle_time, self.turbocharger,
+                        self.volume, self.pressure, self.temperature, self.quantity, stroke_timesteps, cycles,
+                        code_version(Piston))
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            vars(self).update(vars(Piston.load_checkpoint(cached)))
+            return
+
+        for i in range(cycles):
+            self.simulate_cycle(stroke_timesteps)
+
+        if cache is not None:
+            cache.put(key, self.save_checkpoint)
+
+    def display_cycle(self, stroke_timesteps: int, cache: ResultCache | None = None):
+        """Display the data in a pressure volume graph"""
+        self.run_cycles(stroke_timesteps, cache=cache)
 
         plt.style.use("dark_background")
 
@@ -142,8 +226,8 @@ class Piston:
 
         plt.show()
 
-    def get_work(self, stroke_timesteps: int):
-        """calculate total work of a cycle in Joules"""
+    def cycle_work(self, stroke_timesteps: int):
+        """simulate one cycle and return its total work in Joules (without printing)"""
         self.reset()
         self.simulate_cycle(stroke_timesteps)
 
@@ -155,6 +239,12 @@ class Piston:
             if v[i] != v[i+1]:
                 self.work += (p[i]+p[i+1]/2) * (v[i+1] - v[i])
 
+        return self.work
+
+    def get_work(self, stroke_timesteps: int):
+        """calculate total work of a cycle in Joules"""
+        self.cycle_work(stroke_timesteps)
+
         print("Total work of one piston cycle is:")
         print(f"{self.work:.2f} Joules")
 
@@ -172,12 +262,10 @@ class Piston:
         print(f"Engine power in watts: {engine_power:.2f}")
         print(f"Engine power in horsepower: {engine_power / 745 :.2f}")
 
-    def work_animation(self, cycles: int):
-        """Make an animation with the work cycle"""
-        self.reset()
-
-        for i in range(cycles):
-            self.simulate_cycle(60)
+    def work_animation(self, cycles: int, cache: ResultCache | None = None, workers: int | None = None):
+        """Make an animation with the work cycle
+        workers - processes rendering the gif (all cores by default)"""
+        self.run_cycles(60, cycles, cache)
         
         v = self.volume_data
         p = self.pressure_data
@@ -206,9 +294,9 @@ class Piston:
             txt.set_text(f"Work = {work:.2f} J")
             return txt,
 
-        ani = FuncAnimation(fig, update, frames = len(work_data), blit = False, interval = 100)
+        export_animation("Four_Cycle_Engine/Work_Animation.gif", fig, update, len(work_data), fps = 10, workers = workers)
 
-        ani.save("Four_Cycle_Engine/Work_Animation.gif")
+        ani = FuncAnimation(fig, update, frames = len(work_data), blit = False, interval = 100)
 
         plt.show()
 
@@ -227,13 +315,17 @@ class Piston:
         self.pressure_data = np.append(self.pressure_data, self.pressure)
         self.temperature_data = np.append(self.temperature_data, self.temperature)
 
-s63 = Piston(89, 88.3, 10, cycle_time = 16, turbocharger = True)
-"""
-stroke_timesteps = 200
+if __name__ == "__main__":
+    s63 = Piston(89, 88.3, 10, cycle_time = 16, turbocharger = True)
+    """
+    stroke_timesteps = 200
 
 
-s63.get_power(stroke_timesteps, 8)
-"""
+    s63.get_power(stroke_timesteps, 8)
+    """
+
+    #with --cache, reuse the cycles of a previous run with the same inputs and code
+    cache = ResultCache() if "--cache" in sys.argv else None
 
-s63.display_cycle(200)
-s63.work_animation(2)
\ No newline at end of file
+    s63.display_cycle(200, cache)
+    s63.work_animation(2, cache)
\ No newline at end of file
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import numpy as np
+from Piston import Piston
+
+"""Resume check: a cycle interrupted at a checkpoint and resumed with load_checkpoint
+must end bit-identically to the same cycle run without interruption.
+The cycle times include fractional ones (they must survive the checkpoint unrounded).
+Exits with status 1 on any difference"""
+
+STROKE_TIMESTEPS = 500
+#the last checkpoint of the cycle is written mid-way through the power stroke
+CHECKPOINT_EVERY = 1300
+
+ENGINES = {"S63, 16 ms cycle": (89, 88.3, 10, 16, True),
+           "S63, 16.5 ms cycle": (89, 88.3, 10, 16.5, True),
+           "naturally aspirated, 23.7 ms cycle": (89, 88.3, 10, 23.7, False)}
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "piston.npz")
+
+        for name, parameters in ENGINES.items():
+            reference = Piston(*parameters)
+            reference.simulate_cycle(STROKE_TIMESTEPS)
+
+            #the checkpointed run stands in for a run that was killed after its last save
+            Piston(*parameters).simulate_cycle(STROKE_TIMESTEPS, checkpoint_path=path, checkpoint_every=CHECKPOINT_EVERY)
+            resumed = Piston.load_checkpoint(path)
+            resumed_from = resumed.cycle_step
+            resumed.simulate_cycle(STROKE_TIMESTEPS)
+
+            identical = (resumed.cycle_time == reference.cycle_time
+                         and all(np.array_equal(getattr(resumed, data), getattr(reference, data))
+                                 for data in ("volume_data", "pressure_data", "temperature_data")))
+            print(f"{name}: resumed at step {resumed_from}, {'identical' if identical else 'DIFFERENT'}")
+            if not identical:
+                failures.append(name)
+
+    print("resume check failed" if failures else "resume check passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
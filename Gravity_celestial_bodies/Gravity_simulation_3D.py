@@ -1,35 +1,175 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 
+from barnes_hut import barnes_hut_accelerations, scatter_add
+from integrators import get_integrator
+from kepler import kepler_propagate
+from collisions import find_overlaps, merge_groups
+from trajectory_file import TrajectoryRecorder
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Plotting"))
+from trajectory_plot import plot_trajectories
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Result_cache"))
+from result_cache import write_npz
+
 """Gravity simulation module
 Works for both 2D and 3D
 For Blender visualisation"""
 
+class TrajectoryBuffer:
+    """Preallocated storage for recorded rows (e.g. positions)
+    Appends are amortised O(1): the capacity doubles when the buffer is full
+    instead of copying the whole history on every step"""
+    def __init__(self, first_row, capacity: int = 1024):
+        first_row = np.asarray(first_row, dtype=float)
+
+        self.buffer = np.empty((max(capacity, 1),) + first_row.shape)
+        self.buffer[0] = first_row
+        self.length = 1
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Buffer holding a copy of already recorded rows"""
+        rows = np.asarray(rows, dtype=float)
+        trajectory = cls(rows[0], capacity=len(rows))
+        trajectory.buffer[:len(rows)] = rows
+        trajectory.length = len(rows)
+        return trajectory
+
+    @property
+    def data(self):
+        """View of the recorded rows (no copy)"""
+        return self.buffer[:self.length]
+
+    def reserve(self, capacity: int):
+        """Grow the buffer so it can hold at least `capacity` rows"""
+        if capacity <= len(self.buffer):
+            return
+        new_buffer = np.empty((capacity,) + self.buffer.shape[1:])
+        new_buffer[:self.length] = self.buffer[:self.length]
+        self.buffer = new_buffer
+
+    def append(self, row):
+        if self.length == len(self.buffer):
+            self.reserve(2 * len(self.buffer))
+        self.buffer[self.length] = row
+        self.length += 1
+
+    def reset(self, first_row):
+        """Forget the history and start again from `first_row`, keeping the capacity"""
+        self.buffer[0] = first_row
+        self.length = 1
+
 class CelestialBody:
-    def __init__(self, mass: int, position_vector: list[int], velocity_vector: list[int], name: str = ""):
+    def __init__(self, mass: int, position_vector: list[int], velocity_vector: list[int], name: str = "", radius: float = 0.0):
         """Units:
         mass - kilograms (kg)
-        position - thosands of kilometers (1000 km)
+        position, radius - thosands of kilometers (1000 km)
         time - seconds (s)
         velocity - kilometers per second (km/s)
-        forces - Newtons (N)"""
+        forces - Newtons (N)
+
+        Once added to a Simulation the body becomes a view into the
+        simulation's (N, 3) state arrays, so mass, position, velocity and
+        forces read and write the shared arrays directly."""
         self.name = name
+        #only used for collisions
+        self.radius = radius
 
-        self.mass = mass
+        #set when the body is added to a simulation
+        self.simulation = None
+        self.index = None
 
-        self.position = np.array(position_vector)
-        self.velocity = np.array(velocity_vector)
+        self._mass = mass
+
+        self._position = np.array(position_vector, dtype=float)
+        self._velocity = np.array(velocity_vector, dtype=float)
 
         #forces are calculated by the simulation
-        self.forces = np.zeros_like(self.position)
+        self._forces = np.zeros_like(self._position)
+
+        self.trajectory = TrajectoryBuffer(self.position)
+
+    def bind(self, simulation, index: int):
+        """Turn the body into a view of row `index` in the simulation state arrays"""
+        self.simulation = simulation
+        self.index = index
+
+    def unbind(self):
+        """Keep a copy of the current state and stop being a view (body removed from the simulation)"""
+        self._mass = self.mass
+        self._position = self.position.copy()
+        self._velocity = self.velocity.copy()
+        self._forces = self.forces.copy()
+        self.simulation = None
+        self.index = None
+
+    @property
+    def position_data(self):
+        """Recorded positions, (steps, 3) view into the trajectory buffer"""
+        return self.trajectory.data
+
+    @property
+    def mass(self):
+        if self.simulation is None:
+            return self._mass
+        return self.simulation.masses[self.index]
+
+    @mass.setter
+    def mass(self, value):
+        if self.simulation is None:
+            self._mass = value
+        else:
+            self.simulation.masses[self.index] = value
+
+    @property
+    def position(self):
+        if self.simulation is None:
+            return self._position
+        return self.simulation.positions[self.index]
+
+    @position.setter
+    def position(self, value):
+        if self.simulation is None:
+            self._position = np.array(value, dtype=float)
+        else:
+            self.simulation.positions[self.index] = value
+
+    @property
+    def velocity(self):
+        if self.simulation is None:
+            return self._velocity
+        return self.simulation.velocities[self.index]
 
-        self.position_data = np.array([self.position])
+    @velocity.setter
+    def velocity(self, value):
+        if self.simulation is None:
+            self._velocity = np.array(value, dtype=float)
+        else:
+            self.simulation.velocities[self.index] = value
+
+    @property
+    def forces(self):
+        if self.simulation is None:
+            return self._forces
+        return self.simulation.forces[self.index]
+
+    @forces.setter
+    def forces(self, value):
+        if self.simulation is None:
+            self._forces = np.array(value, dtype=float)
+        else:
+            self.simulation.forces[self.index] = value
 
     def reset_body(self, position_vector: list[int], velocity_vector: list[int]):
-        self.position = np.array(position_vector)
-        self.velocity = np.array(velocity_vector)
+        self.position = position_vector
+        self.velocity = velocity_vector
         
-        self.position_data = np.array([self.position])
+        self.trajectory.reset(self.position)
 
     def update_acceleration(self):
         """Using Newton's second law
@@ -52,14 +192,132 @@ class CelestialBody:
         self.store_data()
 
     def store_data(self):
-        self.position_data = np.vstack([self.position_data, self.position])
+        self.trajectory.append(self.position)
+
+class TestParticles:
+    def __init__(self, positions, velocities, name: str = "", record_every: int = 1):
+        """Massless tracers (dust, probes, debris): they feel the gravity of the
+        massive bodies but exert none, so they cost O(K * M) instead of joining the pairs
+        positions (K, 3) in 1000 km, velocities (K, 3) in km/s
+        record_every - store the particle positions every n-th simulation step"""
+        self.name = name
+        self.positions = np.array(positions, dtype=float)
+        self.velocities = np.array(velocities, dtype=float)
+
+        self.record_every = record_every
+        self.trajectory = TrajectoryBuffer(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def position_data(self):
+        """Recorded positions, (records, K, 3) view into the trajectory buffer"""
+        return self.trajectory.data
+
+class CombinedState:
+    """Massive bodies followed by every test particle population, presented to the
+    integrators as one state so the tracers are advanced with the same scheme"""
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.body_count = len(simulation.positions)
+
+        self.positions = np.concatenate([simulation.positions] + [particles.positions for particles in simulation.test_particles])
+        self.velocities = np.concatenate([simulation.velocities] + [particles.velocities for particles in simulation.test_particles])
+
+    def compute_accelerations(self):
+        self.simulation.positions[:] = self.positions[:self.body_count]
+        return np.concatenate([self.simulation.compute_accelerations(),
+                               self.simulation.particle_accelerations(self.positions[self.body_count:])])
+
+    def write_back(self):
+        """Copy the advanced state into the simulation and particle arrays"""
+        self.simulation.positions[:] = self.positions[:self.body_count]
+        self.simulation.velocities[:] = self.velocities[:self.body_count]
+
+        start = self.body_count
+        for particles in self.simulation.test_particles:
+            particles.positions[:] = self.positions[start:start + len(particles)]
+            particles.velocities[:] = self.velocities[start:start + len(particles)]
+            start += len(particles)
 
 class Simulation:
     GRAVITATION = 6.674e-11 #N * m^2 / kg^2
 
-    def __init__(self, bodies: list[CelestialBody]):
+    def __init__(self, bodies: list[CelestialBody], solver: str = "direct", opening_angle: float = 0.5,
+                 integrator = "euler", track_energy: bool = False, softening: float = 0.0,
+                 record_every: int = 1, keep_in_memory: bool = True, workers: int = 1, tile_size: int = 1024,
+                 collisions: bool = False):
+        """Gather the bodies into contiguous struct-of-arrays state:
+        masses (N,), positions, velocities and forces (N, 3) (or (N, 2) in 2D)
+
+        solver - "direct" (all pairs, exact) or "barnes_hut" (tree, for large body counts)
+        opening_angle - Barnes-Hut accuracy parameter, smaller is more accurate
+        integrator - "euler", "leapfrog", "yoshida4", "rk4" or an Integrator instance
+        track_energy - store the initial total energy so energy_drift() can be reported
+                       (one O(N^2) pass, leave off for very large body counts)
+        softening - gravitational softening length (1000 km), forces use r^2 + softening^2
+        record_every - record positions every n-th step (in memory and/or to a file, see record_to)
+        keep_in_memory - keep the recorded positions in the body trajectory buffers
+        workers - threads for the direct solver, the target bodies are split into tiles
+        tile_size - target bodies per tile, bounds the (tile, N, 3) temporaries; systems with
+                    more bodies than one tile (or workers > 1) use the tiled direct solver
+        collisions - merge bodies whose radii overlap (mass and momentum conserving)"""
         self.bodies = bodies
 
+        match solver:
+            case "direct" | "barnes_hut":
+                self.solver = solver
+            case _:
+                print("Invalid solver type. Defaulting to direct...")
+                self.solver = "direct"
+        self.opening_angle = opening_angle
+        self.softening = softening
+        self.workers = workers
+        self.tile_size = tile_size
+        #thread pool for the tiled direct solver (created on first use)
+        self.executor = None
+
+        self.masses = np.array([body.mass for body in bodies], dtype=float)
+        self.positions = np.array([body.position for body in bodies], dtype=float)
+        self.velocities = np.array([body.velocity for body in bodies], dtype=float)
+        self.forces = np.zeros_like(self.positions)
+        self.radii = np.array([body.radius for body in bodies], dtype=float)
+
+        self.collisions = collisions
+        #conserved quantity time series, see enable_diagnostics
+        self.diagnostics = None
+        self.diagnostics_every = 0
+        self.potential_cache = None
+        #(time, survivor name, absorbed name) for every merger
+        self.mergers = []
+
+        # every unordered pair (i < j) is evaluated once, Newton's third law gives the other half
+        # (built on the first direct force evaluation)
+        self.pair_i, self.pair_j = None, None
+
+        for index, body in enumerate(bodies):
+            body.bind(self, index)
+
+        self.integrator = get_integrator(integrator)
+        self.time = 0.0
+        self.steps = 0
+        #step sizes vary in adaptive runs, so the time of every record is kept
+        self.time_trajectory = TrajectoryBuffer(self.time)
+        self.force_evaluations = 0
+
+        self.record_every = record_every
+        self.keep_in_memory = keep_in_memory
+        self.recorder = None
+        self.test_particles = []
+        #hierarchical mode: tight pairs (index1, index2) moved analytically around their centre of mass
+        self.binaries = []
+        self.outer = None
+        #step proposed by the adaptive driver for its next step
+        self.next_time_step = None
+
+        self.initial_energy = self.total_energy() if track_energy else None
+
     def get_gravity_force(self, body1: CelestialBody, body2: CelestialBody):
         """Calculate the gravity between two objects using the law of universal gravitation"""
         r1_vector = body1.position * 1e+6 #convert to meters
@@ -75,22 +333,727 @@ class Simulation:
         return force_magnitude * orientation
 
     def update_gravity(self):
-        """Updates the gravity force for every simulated body"""
-        for selected_body in self.bodies:
-            selected_body.forces = np.zeros_like(selected_body.forces)
-            # update the force for each body to zero and calculate gravity with each other object
-            for body in self.bodies:
-                if body != selected_body:
-                    selected_body.forces = selected_body.forces + self.get_gravity_force(selected_body, body)
+        """Updates the gravity force for every simulated body with the selected solver"""
+        match self.solver:
+            case "barnes_hut":
+                self.update_gravity_barnes_hut()
+            case _:
+                self.update_gravity_direct()
 
-    def update_simulation(self, time_step):
-        """Time unit: seconds (s)"""
+    def update_gravity_barnes_hut(self):
+        """Approximate the forces with a Barnes-Hut tree built over the current positions"""
+        accelerations = barnes_hut_accelerations(self.positions * 1e+6, self.masses, #convert to meters
+                                                 self.opening_angle, self.GRAVITATION,
+                                                 softening=self.softening * 1e+6)
+        # F = m * a (Newtons)
+        self.forces[:] = accelerations * self.masses[:, None]
+
+    def update_gravity_direct(self):
+        """Exact forces in one broadcast pass over all pairs
+        Large systems (or workers > 1) are split into tiles instead, see update_gravity_tiled"""
+        if self.workers > 1 or len(self.positions) > self.tile_size:
+            self.update_gravity_tiled()
+            return
+
+        if self.pair_i is None:
+            self.pair_i, self.pair_j = np.triu_indices(len(self.bodies), k=1)
+        i, j = self.pair_i, self.pair_j
+
+        # separation from body i to body j (meters)
+        separation = (self.positions[j] - self.positions[i]) * 1e+6
+        distance = np.sqrt(np.einsum("pk,pk->p", separation, separation) + np.power(self.softening * 1e+6, 2))
+
+        # F_ij = G * m_i * m_j * r_ij / |r_ij|^3
+        magnitude = self.GRAVITATION * self.masses[i] * self.masses[j] / np.power(distance, 3)
+        pair_forces = separation * magnitude[:, None]
+
+        self.forces[:] = 0.0
+        scatter_add(self.forces, i, pair_forces)
+        scatter_add(self.forces, j, -pair_forces)
+
+        if self.diagnostics is not None:
+            #the distances are already here, the potential energy is one more sum
+            self.cache_potential(-self.GRAVITATION * np.sum(self.masses[i] * self.masses[j] / distance))
+
+    def add_test_particles(self, positions, velocities, name: str = "", record_every: int = 1):
+        """Add a population of massless test particles, returns the TestParticles"""
+        particles = TestParticles(positions, velocities, name, record_every)
+        self.test_particles.append(particles)
+        return particles
+
+    def particle_accelerations(self, particle_positions, tile_size: int = 4096):
+        """Accelerations (km/s^2) of massless particles from the massive bodies only,
+        computed in particle tiles so the (tile, M, 3) temporaries stay bounded"""
+        accelerations = np.empty_like(particle_positions)
+        massive_positions = self.positions * 1e+6 #convert to meters
+        softening_squared = np.power(self.softening * 1e+6, 2)
+
+        for start in range(0, len(particle_positions), tile_size):
+            stop = min(start + tile_size, len(particle_positions))
+            # separation from each particle to each massive body (meters)
+            separation = massive_positions[None, :, :] - particle_positions[start:stop, None, :] * 1e+6
+            distance_squared = np.einsum("tmk,tmk->tm", separation, separation) + softening_squared
+            # a = sum_j G * m_j * r / |r|^3
+            weights = self.GRAVITATION * self.masses[None, :] / np.power(distance_squared, 1.5)
+            #divide to convert meters to kilometers
+            accelerations[start:stop] = np.einsum("tmk,tm->tk", separation, weights) / 1000
+        return accelerations
+
+    def integrate(self, time_step: float):
+        """One integrator step of the bodies and, if there are any, the test particles"""
+        if self.binaries:
+            self.integrate_hierarchical(time_step)
+            return
+
+        if not self.test_particles:
+            self.integrator.step(self, time_step)
+            return
+
+        state = CombinedState(self)
+        self.integrator.step(state, time_step)
+        state.write_back()
+
+    def add_binary(self, body1: CelestialBody, body2: CelestialBody):
+        """Declare a tight, isolated pair: its internal orbit is propagated analytically
+        (Kepler solver) and only its centre of mass takes part in the N-body integration
+        Raises ValueError for an unbound pair (it would not stay a tight binary)"""
+        i, j = body1.index, body2.index
+        mu = self.GRAVITATION * (self.masses[i] + self.masses[j])
+        distance = np.linalg.norm(self.positions[j] - self.positions[i]) * 1e+6 #convert to meters
+        speed = np.linalg.norm(self.velocities[j] - self.velocities[i]) * 1000 #convert to m/s
+        #specific orbital energy, negative for bound orbits
+        if speed * speed / 2 - mu / distance >= 0:
+            raise ValueError(f"Invalid binary: {body1.name} and {body2.name} are not bound to each other")
+
+        self.binaries.append((i, j))
+        self.outer = None
+
+    def detect_binaries(self, separation_ratio: float = 0.1):
+        """Declare every mutually nearest, bound pair whose apoapsis is below
+        separation_ratio times the distance to the closest other body, returns the new pairs"""
+        members = {index for pair in self.binaries for index in pair}
+        positions = self.positions * 1e+6 #convert to meters
+        velocities = self.velocities * 1000 #convert to m/s
+
+        distance = np.linalg.norm(positions[None, :, :] - positions[:, None, :], axis=2)
+        np.fill_diagonal(distance, np.inf)
+        nearest = np.argmin(distance, axis=1)
+
+        found = []
+        for i, j in enumerate(nearest):
+            if i > j or nearest[j] != i or i in members or j in members:
+                continue
+
+            mu = self.GRAVITATION * (self.masses[i] + self.masses[j])
+            relative_position = positions[j] - positions[i]
+            relative_velocity = velocities[j] - velocities[i]
+            r = np.linalg.norm(relative_position)
+            speed_squared = np.dot(relative_velocity, relative_velocity)
+
+            #bound orbits only (negative specific energy)
+            energy = speed_squared / 2 - mu / r
+            if energy >= 0:
+                continue
+            semi_major_axis = -mu / (2 * energy)
+            eccentricity = np.linalg.norm(((speed_squared - mu / r) * relative_position
+                                           - np.dot(relative_position, relative_velocity) * relative_velocity) / mu)
+
+            #closest third body to the pair's centre of mass
+            centre = (self.masses[i] * positions[i] + self.masses[j] * positions[j]) / (self.masses[i] + self.masses[j])
+            others = np.ones(len(positions), dtype=bool)
+            others[[i, j]] = False
+            third = np.min(np.linalg.norm(positions[others] - centre, axis=1)) if others.any() else np.inf
+
+            if semi_major_axis * (1 + eccentricity) < separation_ratio * third:
+                self.add_binary(self.bodies[i], self.bodies[j])
+                found.append((self.bodies[i], self.bodies[j]))
+        return found
+
+    def build_outer(self):
+        """Outer simulation: single bodies plus one centre-of-mass body per binary,
+        sharing this simulation's settings and test particles"""
+        members = {index for pair in self.binaries for index in pair}
+        self.outer_singles = np.array([index for index in range(len(self.bodies)) if index not in members], dtype=int)
+
+        bodies = [CelestialBody(self.masses[index], self.positions[index], self.velocities[index], self.bodies[index].name)
+                  for index in self.outer_singles]
+        for i, j in self.binaries:
+            total_mass = self.masses[i] + self.masses[j]
+            centre = (self.masses[i] * self.positions[i] + self.masses[j] * self.positions[j]) / total_mass
+            centre_velocity = (self.masses[i] * self.velocities[i] + self.masses[j] * self.velocities[j]) / total_mass
+            bodies.append(CelestialBody(total_mass, centre, centre_velocity, f"{self.bodies[i].name} + {self.bodies[j].name}"))
+
+        self.outer = Simulation(bodies, solver=self.solver, opening_angle=self.opening_angle,
+                                integrator=type(self.integrator)(), softening=self.softening,
+                                keep_in_memory=False, workers=self.workers, tile_size=self.tile_size)
+        self.outer.test_particles = self.test_particles
+        self.written_positions = self.positions.copy()
+        self.written_velocities = self.velocities.copy()
+
+    def outer_simulation(self):
+        """The outer simulation, rebuilt when the bodies were moved from outside (restore, resume, setters)"""
+        if (self.outer is None or not np.array_equal(self.positions, self.written_positions)
+                or not np.array_equal(self.velocities, self.written_velocities)):
+            self.build_outer()
+        return self.outer
+
+    def integrate_hierarchical(self, time_step: float):
+        """Outer N-body step of singles and binary centres of mass, then an analytic Kepler
+        step of each binary's relative orbit (the outer bodies' tides on a binary are neglected,
+        and test particles see a binary as one point mass)"""
+        self.outer_simulation()
+
+        relative = [(self.positions[j] - self.positions[i], self.velocities[j] - self.velocities[i]) for i, j in self.binaries]
+
+        evaluations = self.outer.force_evaluations
+        self.outer.integrate(time_step)
+        self.force_evaluations += self.outer.force_evaluations - evaluations
+
+        singles = len(self.outer_singles)
+        self.positions[self.outer_singles] = self.outer.positions[:singles]
+        self.velocities[self.outer_singles] = self.outer.velocities[:singles]
+
+        for number, ((i, j), (relative_position, relative_velocity)) in enumerate(zip(self.binaries, relative)):
+            mu = self.GRAVITATION * (self.masses[i] + self.masses[j])
+            #the solver works in SI units
+            new_position, new_velocity = kepler_propagate(relative_position * 1e+6, relative_velocity * 1000, mu, time_step)
+            new_position, new_velocity = new_position / 1e+6, new_velocity / 1000
+
+            # r_1 = R - m_2 / M * r, r_2 = R + m_1 / M * r
+            total_mass = self.masses[i] + self.masses[j]
+            centre, centre_velocity = self.outer.positions[singles + number], self.outer.velocities[singles + number]
+            self.positions[i] = centre - self.masses[j] / total_mass * new_position
+            self.positions[j] = centre + self.masses[i] / total_mass * new_position
+            self.velocities[i] = centre_velocity - self.masses[j] / total_mass * new_velocity
+            self.velocities[j] = centre_velocity + self.masses[i] / total_mass * new_velocity
+
+        self.written_positions = self.positions.copy()
+        self.written_velocities = self.velocities.copy()
+
+    def save_state(self):
+        """Copies of every evolving array (bodies and test particles)"""
+        return [array.copy() for array in self.state_arrays()]
+
+    def restore_state(self, saved):
+        for array, copy in zip(self.state_arrays(), saved):
+            array[:] = copy
+        self.integrator.reset()
+
+    def state_arrays(self):
+        arrays = [self.positions, self.velocities]
+        for particles in self.test_particles:
+            arrays += [particles.positions, particles.velocities]
+        return arrays
+
+    def update_gravity_tiled(self):
+        """Exact forces with the target bodies split into tiles of tile_size, computed on a
+        thread pool of `workers` threads (NumPy releases the GIL inside the array operations)
+        Each tile only writes its own rows of the force array"""
+        positions = self.positions * 1e+6 #convert to meters
+        softening_squared = np.power(self.softening * 1e+6, 2)
+
+        def tile_forces(start):
+            stop = min(start + self.tile_size, len(positions))
+            # separation from each target body to every body (meters), (tile, N, 3)
+            separation = positions[None, :, :] - positions[start:stop, None, :]
+            distance_squared = np.einsum("tnk,tnk->tn", separation, separation) + softening_squared
+            with np.errstate(divide="ignore"):
+                inverse_cube = np.power(distance_squared, -1.5)
+            # no force from the body itself
+            inverse_cube[np.arange(stop - start), np.arange(start, stop)] = 0.0
+
+            # F_i = G * m_i * sum_j m_j * r_ij / |r_ij|^3
+            weights = self.GRAVITATION * self.masses[None, :] * inverse_cube
+            self.forces[start:stop] = np.einsum("tnk,tn->tk", separation, weights) * self.masses[start:stop, None]
+
+            if self.diagnostics is not None:
+                # every pair is seen from both sides, hence the 1/2
+                # 1 / r = cbrt(1 / r^3), zero for the body itself
+                inverse_distance = np.cbrt(inverse_cube)
+                return -0.5 * self.GRAVITATION * np.sum(self.masses[start:stop, None] * self.masses[None, :] * inverse_distance)
+            return 0.0
+
+        starts = range(0, len(positions), self.tile_size)
+        if self.workers > 1:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers)
+            potentials = list(self.executor.map(tile_forces, starts))
+        else:
+            potentials = [tile_forces(start) for start in starts]
+
+        if self.diagnostics is not None:
+            self.cache_potential(sum(potentials))
+
+    @property
+    def time_data(self):
+        """Time of every recorded position (s)"""
+        return self.time_trajectory.data
+
+    def reserve(self, steps: int):
+        """Size every trajectory buffer up front for the planned number of steps"""
+        if not self.keep_in_memory:
+            return
+        records = steps // self.record_every
+        self.time_trajectory.reserve(self.time_trajectory.length + records)
+        for body in self.bodies:
+            body.trajectory.reserve(body.trajectory.length + records)
+
+    def record_to(self, path: str, chunk_frames: int = 1024):
+        """Stream the recorded frames to <path>.bin (raw float64) with a <path>.json header,
+        read them back with trajectory_file.TrajectoryReader"""
+        names = [body.name for body in self.bodies]
+        self.recorder = TrajectoryRecorder(path, names, self.positions.shape[1], self.record_every, chunk_frames)
+        #file column of every body, merged bodies are written as NaN
+        self.recorder_slots = np.arange(len(self.bodies))
+        self.write_frame()
+
+    def write_frame(self):
+        frame = np.full((len(self.recorder.names), self.positions.shape[1]), np.nan)
+        frame[self.recorder_slots] = self.positions
+        self.recorder.write(self.time, frame)
+
+    def close_recorder(self):
+        """Write the last frames and close the trajectory file"""
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def compute_accelerations(self):
+        """Accelerations of every body at the current positions (km/s^2), used by the integrators"""
         self.update_gravity()
+        self.force_evaluations += 1
+        #divide to convert meters to kilometers
+        return self.forces / self.masses[:, None] / 1000
+
+    def kinetic_energy(self):
+        """Total kinetic energy in Joules: sum 1/2 * m * v^2"""
+        velocities = self.velocities * 1000 #convert to m/s
+        return 0.5 * np.sum(self.masses * np.einsum("nk,nk->n", velocities, velocities))
+
+    def cache_potential(self, potential: float):
+        """Keep the potential energy found during a direct force evaluation, with its positions"""
+        self.potential_cache = (potential, self.positions.copy())
+
+    def potential_energy(self, tile_size: int = 1024):
+        """Total gravitational potential energy in Joules: - sum over pairs G * m_i * m_j / r_ij
+        Reuses the value from the last direct force evaluation when the bodies have not moved since,
+        otherwise computed in row tiles so the memory stays bounded for large body counts"""
+        if self.potential_cache is not None and np.array_equal(self.potential_cache[1], self.positions):
+            return self.potential_cache[0]
+
+        positions = self.positions * 1e+6 #convert to meters
+        energy = 0.0
+        for start in range(0, len(positions), tile_size):
+            stop = min(start + tile_size, len(positions))
+            separation = positions[None, :, :] - positions[start:stop, None, :]
+            distance = np.sqrt(np.einsum("tnk,tnk->tn", separation, separation) + np.power(self.softening * 1e+6, 2))
+            # only pairs j > i
+            upper = np.arange(len(positions))[None, :] > np.arange(start, stop)[:, None]
+            pair_energy = np.divide(self.masses[start:stop, None] * self.masses[None, :], distance,
+                                    out=np.zeros_like(distance), where=upper)
+            energy -= pair_energy.sum()
+        return self.GRAVITATION * energy
+
+    def total_energy(self):
+        return self.kinetic_energy() + self.potential_energy()
+
+    def linear_momentum(self):
+        """Total momentum P = sum m * v (kg * m/s)"""
+        return self.masses @ self.velocities * 1000 #convert to m/s
+
+    def angular_momentum(self):
+        """Total angular momentum about the origin L = sum m * r x v (kg * m^2/s), always 3 components"""
+        return self.body_angular_momenta().sum(axis=0)
+
+    def body_angular_momenta(self):
+        """Angular momentum m * r x v of every body about the origin (kg * m^2/s), (N, 3)"""
+        positions, velocities = self.positions * 1e+6, self.velocities * 1000 #convert to meters, m/s
+        if positions.shape[1] == 2:
+            positions = np.pad(positions, ((0, 0), (0, 1)))
+            velocities = np.pad(velocities, ((0, 0), (0, 1)))
+        return self.masses[:, None] * np.cross(positions, velocities)
+
+    def centre_of_mass(self):
+        """Centre of mass position (1000 km)"""
+        return self.masses @ self.positions / self.masses.sum()
+
+    DIAGNOSTICS_COLUMNS = ("time", "kinetic", "potential", "energy",
+                           "momentum_x", "momentum_y", "momentum_z",
+                           "angular_momentum_x", "angular_momentum_y", "angular_momentum_z",
+                           "centre_x", "centre_y", "centre_z",
+                           "momentum_magnitude", "angular_momentum_magnitude")
+
+    def enable_diagnostics(self, every: int = 100):
+        """Measure energy, linear and angular momentum and centre of mass every `every` steps
+        into a compact (records, 13) time series, see diagnostics_data and conservation_report"""
+        self.diagnostics_every = every
+        self.diagnostics = TrajectoryBuffer(self.measure())
+
+    def measure(self):
+        """One diagnostics row, see DIAGNOSTICS_COLUMNS"""
+        kinetic, potential = self.kinetic_energy(), self.potential_energy()
+        centre = np.zeros(3)
+        centre[:self.positions.shape[1]] = self.centre_of_mass()
+        momentum = np.zeros(3)
+        momentum[:self.positions.shape[1]] = self.linear_momentum()
+        angular = self.body_angular_momenta()
+
+        #sum of the bodies' momentum magnitudes, the scale of the (often zero) totals
+        magnitudes = [np.sum(self.masses * np.linalg.norm(self.velocities, axis=1)) * 1000, #convert to m/s
+                      np.sum(np.linalg.norm(angular, axis=1))]
+
+        return np.concatenate([[self.time, kinetic, potential, kinetic + potential],
+                               momentum, angular.sum(axis=0), centre, magnitudes])
+
+    @property
+    def diagnostics_data(self):
+        """Diagnostics columns by name (views into the time series)"""
+        data = self.diagnostics.data
+        return {name: data[:, column] for column, name in enumerate(self.DIAGNOSTICS_COLUMNS)}
+
+    def conservation_report(self):
+        """Print the largest drifts of the conserved quantities since diagnostics were enabled"""
+        data = self.diagnostics_data
+        energy = data["energy"]
+        momentum = self.diagnostics.data[:, 4:7]
+        angular = self.diagnostics.data[:, 7:10]
+        centre = self.diagnostics.data[:, 10:13]
+
+        #the centre of mass moves uniformly with the initial momentum
+        elapsed = data["time"] - data["time"][0]
+        expected = centre[0] + momentum[0] / self.masses.sum() / 1e+6 * elapsed[:, None] #convert meters to 1000 km
+
+        #relative to the bodies' momenta, the totals are about 0 in the centre of mass frame
+        momentum_scale = data["momentum_magnitude"][0] or 1.0
+        angular_scale = data["angular_momentum_magnitude"][0] or 1.0
+
+        print(f"energy drift: {np.max(np.abs(energy - energy[0])) / abs(energy[0]):.3e}")
+        print(f"momentum drift: {np.max(np.linalg.norm(momentum - momentum[0], axis=1)) / momentum_scale:.3e}")
+        print(f"angular momentum drift: {np.max(np.linalg.norm(angular - angular[0], axis=1)) / angular_scale:.3e}")
+        print(f"centre of mass drift: {np.max(np.linalg.norm(centre - expected, axis=1)):.3e} (1000 km)")
+
+    def energy_drift(self):
+        """Relative energy error |E - E0| / |E0| since the start (requires track_energy=True)"""
+        return abs(self.total_energy() - self.initial_energy) / abs(self.initial_energy)
+
+    def update_simulation(self, time_step):
+        """Time unit: seconds (s)
+        Advance the whole state by one step with the selected integrator"""
+        self.integrate(time_step)
+        self.time += time_step
+        self.steps += 1
+
+        if self.collisions:
+            self.handle_collisions()
+        self.store_data()
+
+    def handle_collisions(self):
+        """Merge every group of overlapping bodies into its most massive member:
+        total mass, centre of mass position, momentum conserving velocity and the
+        radius of the combined volume. The absorbed bodies leave the state arrays"""
+        first, second = find_overlaps(self.positions, self.radii)
+        if len(first) == 0:
+            return
+
+        absorbed = []
+        for group in merge_groups(first, second, len(self.bodies)):
+            survivor = group[np.argmax(self.masses[group])]
+            masses = self.masses[group]
+            total_mass = masses.sum()
+
+            self.positions[survivor] = masses @ self.positions[group] / total_mass
+            self.velocities[survivor] = masses @ self.velocities[group] / total_mass
+            self.radii[survivor] = np.cbrt(np.sum(np.power(self.radii[group], 3)))
+            self.masses[survivor] = total_mass
+
+            for index in group[group != survivor]:
+                self.mergers.append((self.time, self.bodies[survivor].name, self.bodies[index].name))
+                absorbed.append(index)
+
+        self.remove_bodies(np.array(absorbed))
+
+    def remove_bodies(self, indices):
+        """Drop bodies from the state arrays and renumber the remaining views"""
+        keep = np.ones(len(self.bodies), dtype=bool)
+        keep[indices] = False
+        new_index = np.cumsum(keep) - 1
+
+        for index in indices:
+            self.bodies[index].unbind()
+        for body, radius in zip(self.bodies, self.radii):
+            body.radius = radius
+
+        self.bodies = [body for body, kept in zip(self.bodies, keep) if kept]
+        self.masses = self.masses[keep]
+        self.positions = self.positions[keep]
+        self.velocities = self.velocities[keep]
+        self.forces = self.forces[keep]
+        self.radii = self.radii[keep]
+        for index, body in enumerate(self.bodies):
+            body.bind(self, index)
 
-        for celestial_body in self.bodies:
-            celestial_body.update_position(time_step)
+        if self.recorder is not None:
+            self.recorder_slots = self.recorder_slots[keep]
+        self.binaries = [(new_index[i], new_index[j]) for i, j in self.binaries if keep[i] and keep[j]]
+        self.outer = None
+        self.pair_i, self.pair_j = None, None
+        self.integrator.reset()
 
-    def plot_data_2D(self):
+    def store_data(self):
+        """Record the current positions every record_every steps"""
+        if self.diagnostics is not None and self.steps % self.diagnostics_every == 0:
+            self.diagnostics.append(self.measure())
+
+        for particles in self.test_particles:
+            if self.steps % particles.record_every == 0:
+                particles.trajectory.append(particles.positions)
+
+        if self.steps % self.record_every:
+            return
+
+        if self.keep_in_memory:
+            self.time_trajectory.append(self.time)
+            for celestial_body in self.bodies:
+                celestial_body.store_data()
+
+        if self.recorder is not None:
+            self.write_frame()
+
+    def simulate(self, time_step: float, steps: int, checkpoint_path: str | None = None, checkpoint_every: int = 1000):
+        """Fixed-step run until `steps` steps in total were taken (continues a resumed run)
+        With a checkpoint_path the state is saved every checkpoint_every steps"""
+        self.reserve(steps - self.steps)
+        while self.steps < steps:
+            self.update_simulation(time_step)
+
+            if checkpoint_path is not None and self.steps % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint_path)
+
+    def save_checkpoint(self, path: str):
+        """Save the full engine state (.npz): bodies, trajectories, integrator, test particles,
+        binaries and diagnostics; replaced atomically (write_npz)"""
+        if self.recorder is not None:
+            self.recorder.flush()
+
+        lengths = np.array([body.trajectory.length for body in self.bodies])
+        state = {"names": np.array([body.name for body in self.bodies]),
+                 "masses": self.masses,
+                 "positions": self.positions,
+                 "velocities": self.velocities,
+                 "forces": self.forces,
+                 "time": self.time,
+                 "steps": self.steps,
+                 "force_evaluations": self.force_evaluations,
+                 "solver": self.solver,
+                 "opening_angle": self.opening_angle,
+                 "softening": self.softening,
+                 "workers": self.workers,
+                 "tile_size": self.tile_size,
+                 "radii": self.radii,
+                 "collisions": self.collisions,
+                 "diagnostics_every": self.diagnostics_every,
+                 "merger_times": np.array([merger[0] for merger in self.mergers], dtype=float),
+                 "merger_names": np.array([merger[1:] for merger in self.mergers], dtype=str).reshape(-1, 2),
+                 "record_every": self.record_every,
+                 "keep_in_memory": self.keep_in_memory,
+                 "integrator": self.integrator.name,
+                 "time_data": self.time_data,
+                 "trajectory_lengths": lengths,
+                 "trajectory_data": np.concatenate([body.position_data for body in self.bodies])}
+
+        if self.initial_energy is not None:
+            state["initial_energy"] = self.initial_energy
+        if self.diagnostics is not None:
+            state["diagnostics"] = self.diagnostics.data
+        if self.next_time_step is not None:
+            state["next_time_step"] = self.next_time_step
+        if self.recorder is not None:
+            state["recorder_path"] = self.recorder.path
+            state["recorder_frames"] = self.recorder.frames
+            state["recorder_chunk"] = len(self.recorder.chunk)
+            state["recorder_names"] = np.array(self.recorder.names)
+            state["recorder_slots"] = self.recorder_slots
+        for key, value in self.integrator.get_state().items():
+            state["integrator_" + key] = value
+        for index, particles in enumerate(self.test_particles):
+            state[f"particles_{index}_name"] = particles.name
+            state[f"particles_{index}_record_every"] = particles.record_every
+            state[f"particles_{index}_positions"] = particles.positions
+            state[f"particles_{index}_velocities"] = particles.velocities
+            state[f"particles_{index}_data"] = particles.position_data
+        if self.binaries:
+            state["binaries"] = np.array(self.binaries)
+        if self.outer is not None:
+            state["outer_positions"] = self.outer.positions
+            state["outer_velocities"] = self.outer.velocities
+            for key, value in self.outer.integrator.get_state().items():
+                state["outer_integrator_" + key] = value
+
+        write_npz(path, state)
+
+    @classmethod
+    def load_checkpoint(cls, path: str):
+        """Rebuild a simulation (with new CelestialBody views) from save_checkpoint,
+        continuing bit-identically; a trajectory file is reopened at the saved frame"""
+        data = np.load(path)
+
+        bodies = [CelestialBody(mass, position, velocity, name=str(name), radius=radius)
+                  for name, mass, position, velocity, radius
+                  in zip(data["names"], data["masses"], data["positions"], data["velocities"], data["radii"])]
+        sim = cls(bodies, solver=str(data["solver"]), opening_angle=float(data["opening_angle"]),
+                  integrator=str(data["integrator"]), softening=float(data["softening"]),
+                  record_every=int(data["record_every"]), keep_in_memory=bool(data["keep_in_memory"]),
+                  workers=int(data["workers"]), tile_size=int(data["tile_size"]), collisions=bool(data["collisions"]))
+
+        sim.forces[:] = data["forces"]
+        sim.mergers = [(float(time), str(survivor), str(absorbed))
+                       for time, (survivor, absorbed) in zip(data["merger_times"], data["merger_names"])]
+        sim.time = float(data["time"])
+        sim.steps = int(data["steps"])
+        sim.force_evaluations = int(data["force_evaluations"])
+        if "initial_energy" in data:
+            sim.initial_energy = float(data["initial_energy"])
+        if "diagnostics" in data:
+            sim.diagnostics_every = int(data["diagnostics_every"])
+            sim.diagnostics = TrajectoryBuffer.from_rows(data["diagnostics"])
+        if "next_time_step" in data:
+            sim.next_time_step = float(data["next_time_step"])
+
+        sim.time_trajectory = TrajectoryBuffer.from_rows(data["time_data"])
+        splits = np.cumsum(data["trajectory_lengths"])[:-1]
+        for body, rows in zip(bodies, np.split(data["trajectory_data"], splits)):
+            body.trajectory = TrajectoryBuffer.from_rows(rows)
+
+        sim.integrator.set_state({key[len("integrator_"):]: data[key] for key in data.files if key.startswith("integrator_")})
+
+        index = 0
+        while f"particles_{index}_positions" in data:
+            particles = sim.add_test_particles(data[f"particles_{index}_positions"], data[f"particles_{index}_velocities"],
+                                               str(data[f"particles_{index}_name"]), int(data[f"particles_{index}_record_every"]))
+            particles.trajectory = TrajectoryBuffer.from_rows(data[f"particles_{index}_data"])
+            index += 1
+
+        if "binaries" in data:
+            sim.binaries = [tuple(int(index) for index in pair) for pair in data["binaries"]]
+        if "outer_positions" in data:
+            sim.build_outer()
+            sim.outer.positions[:] = data["outer_positions"]
+            sim.outer.velocities[:] = data["outer_velocities"]
+            sim.outer.integrator.set_state({key[len("outer_integrator_"):]: data[key] for key in data.files
+                                            if key.startswith("outer_integrator_")})
+            sim.written_positions = sim.positions.copy()
+            sim.written_velocities = sim.velocities.copy()
+
+        if "recorder_path" in data:
+            sim.recorder = TrajectoryRecorder(str(data["recorder_path"]), [str(name) for name in data["recorder_names"]],
+                                              sim.positions.shape[1], sim.record_every,
+                                              int(data["recorder_chunk"]), frames=int(data["recorder_frames"]))
+            sim.recorder_slots = data["recorder_slots"]
+        return sim
+
+    def encounter_time_step(self, factor: float = 0.05):
+        """Shortest pairwise time scale times `factor` (s):
+        free fall time sqrt(r^3 / G(m_i + m_j)) and crossing time r / |v_i - v_j|
+        Small during close passages, so steps shrink only where the dynamics demand it.
+        Binary orbits are propagated analytically, then only the outer system limits the step.
+        Without any pair (a single body) there is no limit: np.inf"""
+        if self.binaries:
+            return self.outer_simulation().encounter_time_step(factor)
+        if len(self.bodies) < 2:
+            return np.inf
+
+        if self.pair_i is None:
+            self.pair_i, self.pair_j = np.triu_indices(len(self.bodies), k=1)
+        i, j = self.pair_i, self.pair_j
+
+        separation = (self.positions[j] - self.positions[i]) * 1e+6 #convert to meters
+        distance = np.sqrt(np.einsum("pk,pk->p", separation, separation) + np.power(self.softening * 1e+6, 2))
+        relative_velocity = np.linalg.norm(self.velocities[j] - self.velocities[i], axis=1) * 1000 #convert to m/s
+
+        free_fall = np.sqrt(np.power(distance, 3) / (self.GRAVITATION * (self.masses[i] + self.masses[j])))
+        with np.errstate(divide="ignore"):
+            crossing = distance / relative_velocity
+
+        return factor * min(free_fall.min(), crossing.min())
+
+    def error_state(self):
+        """Copies of the positions and velocities the step-doubling error is measured on:
+        the massive bodies, or the outer bodies (singles and binary centres) when binaries are
+        propagated analytically. A single massive body has no size or speed of its own,
+        the test particles are measured with it"""
+        if self.binaries:
+            outer = self.outer_simulation()
+            positions, velocities = outer.positions, outer.velocities
+        else:
+            positions, velocities = self.positions, self.velocities
+
+        if len(positions) < 2 and self.test_particles:
+            positions = np.vstack([positions] + [particles.positions for particles in self.test_particles])
+            velocities = np.vstack([velocities] + [particles.velocities for particles in self.test_particles])
+        return positions.copy(), velocities.copy()
+
+    def simulate_until(self, end_time: float, tolerance: float = 1e-8, time_step: float | None = None,
+                       min_time_step: float = 1e-3, max_time_step: float = np.inf, encounter_factor: float = 0.05,
+                       checkpoint_path: str | None = None, checkpoint_every: int = 1000):
+        """Adaptive-step driver: integrate up to `end_time` (s) instead of a fixed step count
+
+        Every step is taken once with dt and twice with dt/2 (step doubling); the
+        difference estimates the local error, relative to the system size and
+        speed. Steps with error above `tolerance` are retried with a smaller dt,
+        the next dt grows or shrinks with (tolerance / error)^(1 / (order + 1)).
+        dt is also capped by encounter_time_step(encounter_factor) for close passages.
+        The more accurate half-step result is kept and recorded, see time_data.
+        With a checkpoint_path the state is saved every checkpoint_every accepted steps."""
+        if time_step is None:
+            time_step = self.next_time_step or self.encounter_time_step(encounter_factor)
+        exponent = 1 / (self.integrator.order + 1)
+
+        while self.time < end_time:
+            time_step = min(time_step, max_time_step, end_time - self.time,
+                            self.encounter_time_step(encounter_factor))
+            time_step = max(time_step, min(min_time_step, end_time - self.time))
+
+            saved = self.save_state()
+            positions, velocities = self.error_state()
+
+            #one full step
+            self.integrate(time_step)
+            full_positions, full_velocities = self.error_state()
+
+            #two half steps from the same start
+            self.restore_state(saved)
+            self.integrate(time_step / 2)
+            self.integrate(time_step / 2)
+            half_positions, half_velocities = self.error_state()
+
+            #error relative to the system size and speed (absolute, in Mm and km/s, if they are zero)
+            position_scale = np.max(np.linalg.norm(positions - positions.mean(axis=0), axis=1)) or 1.0
+            velocity_scale = np.max(np.linalg.norm(velocities - velocities.mean(axis=0), axis=1)) or 1.0
+            error = max(np.max(np.abs(half_positions - full_positions)) / position_scale,
+                        np.max(np.abs(half_velocities - full_velocities)) / velocity_scale)
+
+            factor = 5.0 if error == 0 else min(5.0, max(0.2, 0.9 * np.power(tolerance / error, exponent)))
+
+            if error > tolerance and time_step > min_time_step:
+                #reject: restart from the saved state with a smaller step
+                self.restore_state(saved)
+                time_step = max(time_step * factor, min_time_step)
+                continue
+
+            self.time += time_step
+            self.steps += 1
+            if self.collisions:
+                self.handle_collisions()
+            self.store_data()
+
+            time_step = time_step * factor
+            self.next_time_step = time_step
+
+            if checkpoint_path is not None and self.steps % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint_path)
+
+    def plot_data_2D(self, max_points: int = 4000):
+        """Plot the recorded x-y trajectories, each downsampled to max_points"""
         plt.style.use("dark_background")
 
         fig, ax = plt.subplots()
@@ -100,8 +1063,7 @@ class Simulation:
         ax.set_xlabel("x distance (Mega meters)")
         ax.set_ylabel("y distance (Mega meters)")
 
-        for body in self.bodies:
-            ax.plot(body.position_data[:, 0], body.position_data[:, 1], label = body.name)
+        plot_trajectories(ax, [body.position_data for body in self.bodies], [body.name for body in self.bodies], max_points)
         ax.legend()
 
         plt.show()
@@ -1,6 +1,11 @@
-import numpy as np
+import os
+import sys
+import Gravity_simulation_3D
 from Gravity_simulation_3D import CelestialBody, Simulation
-import pandas as pd
+from keyframe_export import export_simulation
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Result_cache"))
+from result_cache import ResultCache, cache_key, code_version
 
 """Data for the polaris system"""
 
@@ -12,32 +17,38 @@ PolarisB  = CelestialBody(mass = 1.39 * solar_mass, position_vector=[0, 200000,
 
 stars = [PolarisAa, PolarisAb, PolarisB]
 
-sim = Simulation(stars)
+#record every 100th step (601 frames)
+sim = Simulation(stars, record_every = 100)
 
 sim.find_orbital_velocity(PolarisAb, PolarisAa)
 sim.find_orbital_velocity(PolarisB, PolarisAa)
 
-for _ in range(60000):
-    sim.update_simulation(1000)
-
-sim.plot_data_2D()
-
-"""save position data in a csv file (million kilometers unit)"""
-
-Aa_data = np.round(PolarisAa.position_data[0::100] / 1000, 3)
-Ab_data = np.round(PolarisAb.position_data[0::100] / 1000, 3)
-B_data = np.round(PolarisB.position_data[0::100] / 1000, 3)
+#with --cache, reuse the result of a previous run with the same inputs and code
+cache = ResultCache() if "--cache" in sys.argv else None
+key = cache_key(sim.masses, sim.positions, sim.velocities, sim.integrator.name, 1000, 60000, 100,
+                code_version(Gravity_simulation_3D))
+cached = cache.get(key) if cache is not None else None
 
-frame_data = np.arange(1,602)
+if cached is not None:
+    sim = Simulation.load_checkpoint(cached)
+    PolarisAa, PolarisAb, PolarisB = sim.bodies
+else:
+    #continue an interrupted run from its last checkpoint
+    checkpoint = "Gravity_celestial_bodies/Polaris_checkpoint.npz"
+    if os.path.exists(checkpoint):
+        sim = Simulation.load_checkpoint(checkpoint)
+        PolarisAa, PolarisAb, PolarisB = sim.bodies
 
-all_data = np.concatenate((Aa_data, Ab_data, B_data), axis = 1)
+    sim.simulate(1000, 60000, checkpoint_path = checkpoint, checkpoint_every = 5000)
+    os.remove(checkpoint)
 
-print(all_data[-1])
+    if cache is not None:
+        cache.put(key, sim.save_checkpoint)
 
-filepath = "Gravity_celestial_bodies/Polaris_data.csv"
+sim.plot_data_2D()
 
-data_names = ['PolarisAa_x','PolarisAa_y','PolarisAa_z','PolarisAb_x','PolarisAb_y','PolarisAb_z','PolarisB_x','PolarisB_y','PolarisB_z']
+"""save the keyframes for Blender (one frame per recorded position, million kilometers unit)"""
 
-df = pd.DataFrame(all_data, columns=data_names, index=frame_data)
+export_simulation(sim, "Gravity_celestial_bodies/Polaris_keyframes", frame_rate = 24, scale = 1e-3)
 
-df.to_csv(filepath, header=True, index=True, sep=',')
+print(PolarisAa.position_data[-1] / 1000, PolarisAb.position_data[-1] / 1000, PolarisB.position_data[-1] / 1000)
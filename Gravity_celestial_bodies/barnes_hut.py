@@ -0,0 +1,190 @@
+import numpy as np
+
+"""Barnes-Hut tree solver for the gravity simulation
+Works for both 2D (quadtree) and 3D (octree)
+
+The tree is built level by level over Morton (Z-order) keys, so every body
+of a node sits in one contiguous slice of the sorted arrays. The force walk
+is done for all bodies at once: each pass holds (body, node) pairs and either
+accepts the node's centre of mass, sums a leaf directly or opens the node
+into its children."""
+
+def scatter_add(totals, indices, values):
+    """totals[indices] += values with repeated indices (faster than np.add.at for (P, 3) values)"""
+    for axis in range(totals.shape[1]):
+        totals[:, axis] += np.bincount(indices, weights=values[:, axis], minlength=len(totals))
+
+class Octree:
+    def __init__(self, positions, masses, leaf_size: int = 8, max_depth: int | None = None):
+        """positions (N, 2) or (N, 3), masses (N,)
+        leaf_size - nodes with this many bodies or fewer are not split further"""
+        positions = np.asarray(positions, dtype=float)
+        masses = np.asarray(masses, dtype=float)
+        count, dimensions = positions.shape
+
+        self.dimensions = dimensions
+        self.leaf_size = leaf_size
+        #the key has to fit in a signed 64 bit integer
+        self.max_depth = 63 // dimensions if max_depth is None else min(max_depth, 63 // dimensions)
+
+        #root cell: a cube around every body
+        lower = positions.min(axis=0)
+        root_size = np.max(positions.max(axis=0) - lower) * (1 + 1e-9)
+        if root_size == 0:
+            root_size = 1.0
+
+        #sort the bodies along the Z-order curve
+        cells = ((positions - lower) / root_size * (1 << self.max_depth)).astype(np.int64)
+        cells = np.clip(cells, 0, (1 << self.max_depth) - 1)
+        keys = self.morton_keys(cells)
+
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+        self.positions = positions[self.order]
+        self.masses = masses[self.order]
+
+        self.build(root_size)
+
+    def morton_keys(self, cells):
+        """Interleave the bits of the integer cell coordinates"""
+        keys = np.zeros(len(cells), dtype=np.int64)
+        for bit in range(self.max_depth):
+            for axis in range(self.dimensions):
+                keys |= ((cells[:, axis] >> bit) & 1) << (bit * self.dimensions + axis)
+        return keys
+
+    def build(self, root_size):
+        """Create the nodes level by level, splitting only nodes with more than leaf_size bodies"""
+        weighted = self.positions * self.masses[:, None]
+
+        starts = [np.array([0])]
+        counts = [np.array([len(self.positions)])]
+        sizes = [np.array([root_size])]
+        node_masses = [np.array([self.masses.sum()])]
+        node_weighted = [weighted.sum(axis=0, keepdims=True)]
+        node_sums = [self.positions.sum(axis=0, keepdims=True)]
+        child_starts = []
+        child_counts = []
+
+        total_nodes = 1
+        frontier = np.array([0]) #nodes of the previous level, indices local to that level
+
+        for level in range(1, self.max_depth + 1):
+            level_starts, level_counts = starts[-1], counts[-1]
+            frontier = frontier[level_counts[frontier] > self.leaf_size]
+
+            level_child_start = np.full(len(level_starts), -1)
+            level_child_count = np.zeros(len(level_starts), dtype=int)
+
+            if len(frontier) == 0:
+                child_starts.append(level_child_start)
+                child_counts.append(level_child_count)
+                break
+
+            #indices of every body inside the nodes being split
+            parent_counts = level_counts[frontier]
+            body_parent = np.repeat(np.arange(len(frontier)), parent_counts)
+            first = np.repeat(level_starts[frontier] - np.cumsum(parent_counts) + parent_counts, parent_counts)
+            bodies = first + np.arange(len(body_parent))
+
+            #a new child starts where the key prefix (or the parent) changes
+            prefix = self.keys[bodies] >> (self.dimensions * (self.max_depth - level))
+            boundary = np.ones(len(bodies), dtype=bool)
+            boundary[1:] = (prefix[1:] != prefix[:-1]) | (body_parent[1:] != body_parent[:-1])
+            run_starts = np.flatnonzero(boundary)
+            run_counts = np.diff(np.append(run_starts, len(bodies)))
+
+            #children of one parent are contiguous
+            run_parent = body_parent[run_starts]
+            per_parent = np.bincount(run_parent, minlength=len(frontier))
+            level_child_start[frontier] = total_nodes + np.cumsum(per_parent) - per_parent
+            level_child_count[frontier] = per_parent
+            child_starts.append(level_child_start)
+            child_counts.append(level_child_count)
+
+            starts.append(bodies[run_starts])
+            counts.append(run_counts)
+            sizes.append(np.full(len(run_starts), root_size / (1 << level)))
+            node_masses.append(np.add.reduceat(self.masses[bodies], run_starts))
+            node_weighted.append(np.add.reduceat(weighted[bodies], run_starts, axis=0))
+            node_sums.append(np.add.reduceat(self.positions[bodies], run_starts, axis=0))
+
+            #the children are the candidates for the next split
+            frontier = np.arange(len(run_starts))
+            total_nodes += len(run_starts)
+        else:
+            child_starts.append(np.full(len(starts[-1]), -1))
+            child_counts.append(np.zeros(len(starts[-1]), dtype=int))
+
+        self.node_start = np.concatenate(starts)
+        self.node_count = np.concatenate(counts)
+        self.node_size = np.concatenate(sizes)
+        self.node_mass = np.concatenate(node_masses)
+        self.child_start = np.concatenate(child_starts)
+        self.child_count = np.concatenate(child_counts)
+
+        #centre of mass (geometric centre for massless nodes)
+        weighted_sum = np.concatenate(node_weighted)
+        position_sum = np.concatenate(node_sums)
+        has_mass = self.node_mass > 0
+        self.node_com = position_sum / self.node_count[:, None]
+        self.node_com[has_mass] = weighted_sum[has_mass] / self.node_mass[has_mass, None]
+
+    def accelerations(self, opening_angle: float = 0.5, gravitation: float = 1.0, softening: float = 0.0):
+        """Acceleration of every body (original order): a_i = sum G * m_j * (r_j - r_i) / |r_j - r_i|^3
+        A node is accepted as one point mass when size / distance < opening_angle"""
+        count = len(self.positions)
+        accelerations = np.zeros_like(self.positions)
+
+        targets = np.arange(count)
+        nodes = np.zeros(count, dtype=int)
+        theta_squared = opening_angle ** 2
+        softening_squared = softening ** 2
+
+        while len(targets):
+            separation = self.node_com[nodes] - self.positions[targets]
+            distance_squared = np.einsum("pk,pk->p", separation, separation) + softening_squared
+
+            inside = (targets >= self.node_start[nodes]) & (targets < self.node_start[nodes] + self.node_count[nodes])
+            far = ~inside & (self.node_size[nodes] ** 2 < theta_squared * distance_squared)
+
+            #far nodes: one point mass
+            if far.any():
+                contribution = self.node_mass[nodes[far]] / np.power(distance_squared[far], 1.5)
+                scatter_add(accelerations, targets[far], separation[far] * contribution[:, None])
+
+            near = ~far
+            leaf = near & (self.child_count[nodes] == 0)
+
+            #near leaves: direct sum over their bodies, skipping the body itself
+            if leaf.any():
+                leaf_targets, leaf_nodes = targets[leaf], nodes[leaf]
+                leaf_counts = self.node_count[leaf_nodes]
+                pair_targets = np.repeat(leaf_targets, leaf_counts)
+                offsets = np.arange(leaf_counts.sum()) - np.repeat(np.cumsum(leaf_counts) - leaf_counts, leaf_counts)
+                pair_sources = np.repeat(self.node_start[leaf_nodes], leaf_counts) + offsets
+
+                other = pair_sources != pair_targets
+                pair_targets, pair_sources = pair_targets[other], pair_sources[other]
+
+                separation_pairs = self.positions[pair_sources] - self.positions[pair_targets]
+                distance_pairs = np.einsum("pk,pk->p", separation_pairs, separation_pairs) + softening_squared
+                contribution = self.masses[pair_sources] / np.power(distance_pairs, 1.5)
+                scatter_add(accelerations, pair_targets, separation_pairs * contribution[:, None])
+
+            #open the remaining nodes into their children
+            opened = near & ~leaf
+            opened_targets, opened_nodes = targets[opened], nodes[opened]
+            opened_counts = self.child_count[opened_nodes]
+            targets = np.repeat(opened_targets, opened_counts)
+            offsets = np.arange(opened_counts.sum()) - np.repeat(np.cumsum(opened_counts) - opened_counts, opened_counts)
+            nodes = np.repeat(self.child_start[opened_nodes], opened_counts) + offsets
+
+        result = np.empty_like(accelerations)
+        result[self.order] = accelerations * gravitation
+        return result
+
+def barnes_hut_accelerations(positions, masses, opening_angle: float = 0.5, gravitation: float = 1.0, leaf_size: int = 8, softening: float = 0.0):
+    """Build the tree over the current positions and return the accelerations"""
+    tree = Octree(positions, masses, leaf_size=leaf_size)
+    return tree.accelerations(opening_angle, gravitation, softening)
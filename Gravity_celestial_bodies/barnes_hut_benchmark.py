@@ -0,0 +1,53 @@
+import time
+import numpy as np
+from Gravity_simulation_3D import CelestialBody, Simulation
+
+"""Benchmark: Barnes-Hut tree solver against direct summation
+Random star cluster (Gaussian positions, solar masses), one force evaluation
+accuracy - relative force error of each body compared with direct summation"""
+
+solar_mass = 2e30 #kg
+
+def make_cluster(body_count: int, dimensions: int = 3, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    positions = rng.normal(scale=100000, size=(body_count, dimensions)) #1000 km
+    masses = rng.uniform(0.1, 10, body_count) * solar_mass
+
+    return [CelestialBody(mass, position, np.zeros(dimensions)) for mass, position in zip(masses, positions)]
+
+def time_forces(sim: Simulation, repeats: int = 3):
+    """Best wall time of one force evaluation (seconds)"""
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        sim.update_gravity()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    opening_angle = 0.5
+
+    print(f"opening angle: {opening_angle}")
+    print(f"{'dim':>3} {'bodies':>7} {'direct (s)':>11} {'tree (s)':>9} {'median err':>11} {'99% err':>9}")
+
+    for dimensions in (2, 3):
+        for body_count in (1000, 2000, 4000):
+            bodies = make_cluster(body_count, dimensions)
+
+            direct = Simulation(bodies, solver="direct")
+            direct_time = time_forces(direct)
+            direct_forces = direct.forces.copy()
+
+            tree = Simulation(bodies, solver="barnes_hut", opening_angle=opening_angle)
+            tree_time = time_forces(tree)
+
+            error = np.linalg.norm(tree.forces - direct_forces, axis=1) / np.linalg.norm(direct_forces, axis=1)
+            print(f"{dimensions:>3} {body_count:>7} {direct_time:>11.4f} {tree_time:>9.4f} {np.median(error):>11.2e} {np.percentile(error, 99):>9.2e}")
+
+    #too large for the all-pairs solver
+    for body_count in (10000, 50000):
+        tree = Simulation(make_cluster(body_count), solver="barnes_hut", opening_angle=opening_angle)
+        print(f"{3:>3} {body_count:>7} {'-':>11} {time_forces(tree, repeats=1):>9.4f}")
+
+if __name__ == "__main__":
+    main()
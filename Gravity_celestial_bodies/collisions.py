@@ -0,0 +1,73 @@
+from itertools import product
+import numpy as np
+
+"""Collision detection for the gravity simulation
+Broad phase: uniform grid spatial hash, cells as large as the biggest body
+diameter, so overlapping bodies always sit in the same or neighbouring cells.
+Narrow phase: exact sphere overlap test |r_i - r_j| < R_i + R_j."""
+
+#large odd numbers to mix the integer cell coordinates into one hash key
+HASH_PRIMES = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+
+def find_overlaps(positions, radii):
+    """Pairs (i, j), i < j, of overlapping bodies; bodies without radius never collide
+    Near O(N) for bodies spread over many cells"""
+    positions = np.asarray(positions, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+
+    candidates = np.flatnonzero(radii > 0)
+    if len(candidates) < 2:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    cell_size = 2 * radii[candidates].max()
+    cells = np.floor(positions[candidates] / cell_size).astype(np.int64)
+    primes = HASH_PRIMES[:positions.shape[1]]
+
+    #bodies sorted by the hash key of their cell
+    keys = (cells * primes).sum(axis=1)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    first, second = [], []
+    for offset in product((-1, 0, 1), repeat=positions.shape[1]):
+        neighbour_keys = ((cells + np.array(offset)) * primes).sum(axis=1)
+        low = np.searchsorted(sorted_keys, neighbour_keys, side="left")
+        high = np.searchsorted(sorted_keys, neighbour_keys, side="right")
+        counts = high - low
+
+        #every body against every body of the neighbouring cell
+        body = np.repeat(np.arange(len(candidates)), counts)
+        slots = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(low, counts)
+        other = order[slots]
+
+        keep = body < other
+        first.append(body[keep])
+        second.append(other[keep])
+
+    #hash collisions between cells can repeat a pair
+    pairs = np.unique(np.stack([np.concatenate(first), np.concatenate(second)], axis=1), axis=0)
+    i, j = candidates[pairs[:, 0]], candidates[pairs[:, 1]]
+
+    distance = np.linalg.norm(positions[j] - positions[i], axis=1)
+    touching = distance < radii[i] + radii[j]
+    return i[touching], j[touching]
+
+def merge_groups(first, second, count: int):
+    """Group the colliding bodies (union-find), chains of collisions form one group
+    Returns a list of index arrays with two or more bodies each"""
+    parent = np.arange(count)
+
+    def root(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    for i, j in zip(first, second):
+        root_i, root_j = root(i), root(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    members = np.unique(np.concatenate([first, second]))
+    roots = np.array([root(index) for index in members])
+    return [members[roots == group] for group in np.unique(roots)]
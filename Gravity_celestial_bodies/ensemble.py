@@ -0,0 +1,156 @@
+import numpy as np
+
+from Gravity_simulation_3D import Simulation, TrajectoryBuffer
+
+"""Batched gravity simulation: B independent N-body systems advanced at once
+Same units as Gravity_simulation_3D:
+    mass - kilograms (kg)
+    position - thosands of kilometers (1000 km)
+    time - seconds (s)
+    velocity - kilometers per second (km/s)
+
+Used for parameter sweeps (initial velocities, masses...) so that thousands
+of variants run in one vectorized loop instead of one Simulation each."""
+
+class Ensemble:
+    GRAVITATION = Simulation.GRAVITATION
+
+    def __init__(self, masses, positions, velocities, integrator: str = "leapfrog", softening: float = 0.0,
+                 escape_distance: float = np.inf, end_time = np.inf, record_every: int = 0):
+        """masses (B, N) or (N,) shared by every system, positions and velocities (B, N, 3) or (B, N, 2)
+        integrator - "leapfrog" (velocity Verlet) or "euler" (semi-implicit Euler)
+        softening - gravitational softening length (1000 km)
+        escape_distance - a system whose body leaves this distance from its centre of mass diverged (1000 km)
+        end_time - (B,) or scalar, each system stops once its own end time is reached (s)
+        record_every - store every n-th step of all systems (0 = only keep the current state)"""
+        self.positions = np.array(positions, dtype=float)
+        self.velocities = np.array(velocities, dtype=float)
+        self.systems, self.body_count, self.dimensions = self.positions.shape
+        self.masses = np.broadcast_to(np.asarray(masses, dtype=float), (self.systems, self.body_count)).copy()
+
+        match integrator:
+            case "leapfrog" | "euler":
+                self.integrator = integrator
+            case _:
+                print("Invalid integrator type. Defaulting to leapfrog...")
+                self.integrator = "leapfrog"
+
+        self.softening = softening
+        self.escape_distance = escape_distance
+        self.end_time = np.broadcast_to(np.asarray(end_time, dtype=float), (self.systems,)).copy()
+
+        self.time = np.zeros(self.systems)
+        self.steps = 0
+        #masks: systems still integrated, systems stopped because they blew up
+        self.active = self.time < self.end_time
+        self.diverged = np.zeros(self.systems, dtype=bool)
+
+        #leapfrog reuses the accelerations from the end of the previous step
+        self.accelerations = None
+
+        self.record_every = record_every
+        self.position_data = TrajectoryBuffer(self.positions) if record_every else None
+
+    @classmethod
+    def from_bodies(cls, bodies, systems: int, **kwargs):
+        """Repeat one set of CelestialBody initial conditions for every system,
+        ready to be changed per system before simulating"""
+        masses = np.array([body.mass for body in bodies], dtype=float)
+        positions = np.array([body.position for body in bodies], dtype=float)
+        velocities = np.array([body.velocity for body in bodies], dtype=float)
+
+        return cls(np.tile(masses, (systems, 1)),
+                   np.tile(positions, (systems, 1, 1)),
+                   np.tile(velocities, (systems, 1, 1)), **kwargs)
+
+    def compute_accelerations(self, positions, masses):
+        """Accelerations (km/s^2) of every body for a (b, N, 3) batch of positions"""
+        # separation from body i to body j (meters), (b, N, N, 3)
+        separation = (positions[:, None, :, :] - positions[:, :, None, :]) * 1e+6
+        distance_squared = np.einsum("bijk,bijk->bij", separation, separation) + np.power(self.softening * 1e+6, 2)
+
+        # a_i = sum_j G * m_j * r_ij / |r_ij|^3, skipping j == i
+        with np.errstate(divide="ignore"):
+            inverse_cube = np.power(distance_squared, -1.5)
+        diagonal = np.arange(self.body_count)
+        inverse_cube[:, diagonal, diagonal] = 0.0
+
+        accelerations = np.einsum("bijk,bij->bik", separation, self.GRAVITATION * masses[:, None, :] * inverse_cube)
+        #divide to convert meters to kilometers
+        return accelerations / 1000
+
+    def step(self, time_step: float):
+        """Advance every active system by one step (s), systems reaching their end time take a shorter last step"""
+        systems = np.flatnonzero(self.active)
+        if len(systems) == 0:
+            return
+
+        dt = np.minimum(time_step, self.end_time[systems] - self.time[systems])[:, None, None]
+        positions = self.positions[systems]
+        velocities = self.velocities[systems]
+        masses = self.masses[systems]
+
+        match self.integrator:
+            case "euler":
+                velocities += self.compute_accelerations(positions, masses) * dt
+                positions += velocities * dt / 1000
+            case "leapfrog":
+                if self.accelerations is None:
+                    self.accelerations = np.zeros_like(self.positions)
+                    self.accelerations[systems] = self.compute_accelerations(positions, masses)
+                velocities += 0.5 * self.accelerations[systems] * dt
+                positions += velocities * dt / 1000
+                accelerations = self.compute_accelerations(positions, masses)
+                velocities += 0.5 * accelerations * dt
+                self.accelerations[systems] = accelerations
+
+        self.positions[systems] = positions
+        self.velocities[systems] = velocities
+        self.time[systems] += dt[:, 0, 0]
+        self.steps += 1
+
+        self.update_masks(systems)
+
+        if self.record_every and self.steps % self.record_every == 0:
+            self.position_data.append(self.positions)
+
+    def update_masks(self, systems):
+        """Retire systems that reached their end time or diverged (non finite state or escaped body)"""
+        positions = self.positions[systems]
+        finite = np.isfinite(positions).all(axis=(1, 2)) & np.isfinite(self.velocities[systems]).all(axis=(1, 2))
+
+        masses = self.masses[systems]
+        centre = np.einsum("bn,bnk->bk", masses, positions) / masses.sum(axis=1)[:, None]
+        escaped = np.linalg.norm(positions - centre[:, None, :], axis=2).max(axis=1) > self.escape_distance
+
+        diverged = ~finite | escaped
+        self.diverged[systems[diverged]] = True
+        self.active[systems[diverged | (self.time[systems] >= self.end_time[systems])]] = False
+
+    def simulate(self, time_step: float, steps: int | None = None):
+        """Step until every system finished or diverged (or for a fixed number of steps)"""
+        step = 0
+        while self.active.any() and (steps is None or step < steps):
+            self.step(time_step)
+            step += 1
+
+def main():
+    """Example: sweep the initial speed of Polaris Ab over 1000 variants"""
+    from Gravity_simulation_3D import CelestialBody
+
+    solar_mass = 2e30 #kg
+    stars = [CelestialBody(mass = 5.13 * solar_mass, position_vector=[0, 0, 0], velocity_vector=[0, 0, 0], name = "Polaris Aa"),
+             CelestialBody(mass = 1.31 * solar_mass, position_vector=[-100000, 0, -5000], velocity_vector=[0, 82, 1], name = "Polaris Ab"),
+             CelestialBody(mass = 1.39 * solar_mass, position_vector=[0, 200000, 150000], velocity_vector=[45, 0, -10], name = "Polaris B")]
+
+    speeds = np.linspace(40, 140, 1000) #km/s
+    ensemble = Ensemble.from_bodies(stars, len(speeds), end_time=6e7, escape_distance=2e6)
+    ensemble.velocities[:, 1, 1] = speeds
+
+    ensemble.simulate(1000)
+
+    print(f"{np.count_nonzero(ensemble.diverged)} of {len(speeds)} variants escaped")
+    print(f"lowest escaping speed: {speeds[ensemble.diverged].min() if ensemble.diverged.any() else None} km/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import time
+import numpy as np
+from Gravity_simulation_3D import CelestialBody, Simulation
+
+"""Compare the integrators on the Polaris system
+For each scheme and time step: force evaluations, wall time, relative energy
+drift and final position error against a fine Yoshida reference run."""
+
+solar_mass = 2e30 #kg
+
+def make_polaris():
+    return [CelestialBody(mass = 5.13 * solar_mass, position_vector=[0, 0, 0], velocity_vector=[0, 0, 0], name = "Polaris Aa"),
+            CelestialBody(mass = 1.31 * solar_mass, position_vector=[-100000, 0, -5000], velocity_vector=[0, 82, 1], name = "Polaris Ab"),
+            CelestialBody(mass = 1.39 * solar_mass, position_vector=[0, 200000, 150000], velocity_vector=[45, 0, -10], name = "Polaris B")]
+
+def run(integrator: str, time_step: float, end_time: float):
+    sim = Simulation(make_polaris(), integrator=integrator, track_energy=True)
+    steps = int(round(end_time / time_step))
+    sim.reserve(steps)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        sim.update_simulation(time_step)
+    wall_time = time.perf_counter() - start
+
+    return sim, wall_time
+
+def main():
+    end_time = 2e7 #seconds
+
+    reference, _ = run("yoshida4", 250, end_time)
+
+    print(f"{'integrator':>10} {'dt (s)':>7} {'force evals':>12} {'time (s)':>9} {'energy drift':>13} {'position err (1000 km)':>23}")
+    for integrator, time_steps in (("euler", (1000, 4000)),
+                                   ("leapfrog", (1000, 4000, 10000)),
+                                   ("yoshida4", (4000, 10000, 20000)),
+                                   ("rk4", (4000, 10000, 20000))):
+        for time_step in time_steps:
+            sim, wall_time = run(integrator, time_step, end_time)
+            position_error = np.max(np.linalg.norm(sim.positions - reference.positions, axis=1))
+            print(f"{integrator:>10} {time_step:>7} {sim.force_evaluations:>12} {wall_time:>9.3f} {sim.energy_drift():>13.2e} {position_error:>23.2f}")
+
+if __name__ == "__main__":
+    main()
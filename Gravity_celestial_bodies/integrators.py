@@ -0,0 +1,130 @@
+import numpy as np
+
+"""Time integrators for the gravity simulation
+Each integrator advances the simulation state arrays by one time step:
+    positions (1000 km), velocities (km/s), accelerations (km/s^2)
+Accelerations come from simulation.compute_accelerations(), which counts
+the force evaluations so the schemes can be compared by cost."""
+
+class Integrator:
+    name = ""
+    order = 1
+
+    def step(self, simulation, time_step: float):
+        raise NotImplementedError
+
+    def reset(self):
+        """Forget any cached state (after the positions were changed from outside)"""
+        pass
+
+    def get_state(self) -> dict:
+        """Arrays needed to continue bit-identically after a checkpoint"""
+        return {}
+
+    def set_state(self, state: dict):
+        pass
+
+class SemiImplicitEuler(Integrator):
+    """v = v + a * dt, then r = r + v * dt (first order, symplectic)"""
+    name = "euler"
+
+    def step(self, simulation, time_step: float):
+        accelerations = simulation.compute_accelerations()
+        simulation.velocities += accelerations * time_step
+        #divide to convert km to 1000km
+        simulation.positions += simulation.velocities * time_step / 1000
+
+class Leapfrog(Integrator):
+    """Velocity Verlet (kick-drift-kick), second order, symplectic
+    The acceleration at the end of a step is reused at the start of the next one,
+    so each step costs a single force evaluation"""
+    name = "leapfrog"
+    order = 2
+
+    def __init__(self):
+        self.accelerations = None
+        self.positions = None
+
+    def reset(self):
+        self.accelerations = None
+        self.positions = None
+
+    def get_state(self):
+        if self.accelerations is None:
+            return {}
+        return {"accelerations": self.accelerations, "positions": self.positions}
+
+    def set_state(self, state):
+        self.accelerations = np.array(state["accelerations"]) if "accelerations" in state else None
+        self.positions = np.array(state["positions"]) if "positions" in state else None
+
+    def current_accelerations(self, simulation):
+        if self.accelerations is None or not np.array_equal(self.positions, simulation.positions):
+            self.accelerations = simulation.compute_accelerations()
+        return self.accelerations
+
+    def step(self, simulation, time_step: float):
+        simulation.velocities += 0.5 * self.current_accelerations(simulation) * time_step
+        simulation.positions += simulation.velocities * time_step / 1000
+
+        self.accelerations = simulation.compute_accelerations()
+        self.positions = simulation.positions.copy()
+        simulation.velocities += 0.5 * self.accelerations * time_step
+
+class Yoshida4(Integrator):
+    """Fourth order symplectic scheme: three leapfrog drift-kick stages
+    with the Yoshida (1990) coefficients"""
+    name = "yoshida4"
+    order = 4
+
+    W1 = 1 / (2 - np.cbrt(2))
+    W0 = -np.cbrt(2) / (2 - np.cbrt(2))
+    DRIFT = (W1 / 2, (W0 + W1) / 2, (W0 + W1) / 2, W1 / 2)
+    KICK = (W1, W0, W1)
+
+    def step(self, simulation, time_step: float):
+        for drift, kick in zip(self.DRIFT, self.KICK):
+            simulation.positions += drift * simulation.velocities * time_step / 1000
+            simulation.velocities += kick * simulation.compute_accelerations() * time_step
+        simulation.positions += self.DRIFT[-1] * simulation.velocities * time_step / 1000
+
+class RK4(Integrator):
+    """Classic fourth order Runge-Kutta (not symplectic, energy drifts slowly)"""
+    name = "rk4"
+    order = 4
+
+    def step(self, simulation, time_step: float):
+        positions = simulation.positions.copy()
+        velocities = simulation.velocities.copy()
+
+        #derivatives: dr/dt = v / 1000, dv/dt = a(r)
+        k1_r, k1_v = velocities / 1000, simulation.compute_accelerations()
+
+        simulation.positions[:] = positions + 0.5 * time_step * k1_r
+        k2_r, k2_v = (velocities + 0.5 * time_step * k1_v) / 1000, simulation.compute_accelerations()
+
+        simulation.positions[:] = positions + 0.5 * time_step * k2_r
+        k3_r, k3_v = (velocities + 0.5 * time_step * k2_v) / 1000, simulation.compute_accelerations()
+
+        simulation.positions[:] = positions + time_step * k3_r
+        k4_r, k4_v = (velocities + time_step * k3_v) / 1000, simulation.compute_accelerations()
+
+        simulation.positions[:] = positions + time_step / 6 * (k1_r + 2 * k2_r + 2 * k3_r + k4_r)
+        simulation.velocities[:] = velocities + time_step / 6 * (k1_v + 2 * k2_v + 2 * k3_v + k4_v)
+
+INTEGRATORS = {
+    "euler": SemiImplicitEuler,
+    "leapfrog": Leapfrog,
+    "verlet": Leapfrog,
+    "yoshida4": Yoshida4,
+    "rk4": RK4,
+}
+
+def get_integrator(integrator):
+    """Return an Integrator instance from a name ("euler", "leapfrog", "yoshida4", "rk4") or an instance"""
+    if isinstance(integrator, Integrator):
+        return integrator
+    if integrator not in INTEGRATORS:
+        print("Invalid integrator type. Defaulting to euler...")
+        integrator = "euler"
+    return INTEGRATORS[integrator]()
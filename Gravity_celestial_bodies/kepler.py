@@ -0,0 +1,107 @@
+import numpy as np
+
+"""Analytic two-body (Kepler) propagation with universal variables
+Works for elliptic, parabolic and hyperbolic orbits.
+SI units: positions in meters, velocities in m/s, mu = G * (m1 + m2) in m^3/s^2"""
+
+def stumpff_c(z: float):
+    """C(z) = (1 - cos(sqrt(z))) / z"""
+    if z > 1e-8:
+        return (1 - np.cos(np.sqrt(z))) / z
+    if z < -1e-8:
+        return (np.cosh(np.sqrt(-z)) - 1) / -z
+    #series near zero
+    return 1 / 2 - z / 24 + z * z / 720
+
+def stumpff_s(z: float):
+    """S(z) = (sqrt(z) - sin(sqrt(z))) / sqrt(z)^3"""
+    if z > 1e-8:
+        root = np.sqrt(z)
+        return (root - np.sin(root)) / np.power(root, 3)
+    if z < -1e-8:
+        root = np.sqrt(-z)
+        return (np.sinh(root) - root) / np.power(root, 3)
+    return 1 / 6 - z / 120 + z * z / 5040
+
+def kepler_propagate(position, velocity, mu: float, time_step: float, tolerance: float = 1e-12, max_iterations: int = 100):
+    """Relative position and velocity after `time_step` seconds of unperturbed two-body motion
+    Solves the universal Kepler equation F(chi) = 0 for chi, then uses the Lagrange f and g
+    coefficients: r = f * r0 + g * v0, v = f' * r0 + g' * v0
+    F grows monotonically with chi (dF/dchi = r > 0), so the root is first bracketed and
+    Newton steps that leave the bracket are replaced by bisection.
+    Raises RuntimeError if chi does not converge within max_iterations"""
+    position = np.asarray(position, dtype=float)
+    velocity = np.asarray(velocity, dtype=float)
+    if time_step == 0:
+        return position.copy(), velocity.copy()
+
+    r0 = np.linalg.norm(position)
+    radial_velocity = np.dot(position, velocity) / r0
+    # alpha = 1 / a (reciprocal semi-major axis), negative for hyperbolas
+    alpha = 2 / r0 - np.dot(velocity, velocity) / mu
+    root_mu = np.sqrt(mu)
+    direction = np.sign(time_step)
+
+    def kepler_function(chi: float):
+        """F(chi) and dF/dchi, F is taken as +-inf where cosh/sinh overflow (far past the root)"""
+        z = alpha * chi * chi
+        with np.errstate(over="ignore", invalid="ignore"):
+            c, s = stumpff_c(z), stumpff_s(z)
+            function = (r0 * radial_velocity / root_mu * chi * chi * c + (1 - alpha * r0) * np.power(chi, 3) * s
+                        + r0 * chi - root_mu * time_step)
+            derivative = r0 * radial_velocity / root_mu * chi * (1 - z * s) + (1 - alpha * r0) * chi * chi * c + r0
+        if not np.isfinite(function):
+            function = np.sign(chi) * np.inf
+        return function, derivative
+
+    #starting guess: exact for circular orbits, Vallado's logarithmic estimate for hyperbolas
+    chi = root_mu * time_step / r0
+    if alpha > 1e-12:
+        chi = root_mu * alpha * time_step
+    elif alpha < -1e-12:
+        semi_major_axis = 1 / alpha
+        argument = -2 * mu * alpha * time_step / (np.dot(position, velocity)
+                                                  + direction * np.sqrt(-mu * semi_major_axis) * (1 - r0 * alpha))
+        if argument > 0:
+            chi = direction * np.sqrt(-semi_major_axis) * np.log(argument)
+
+    #bracket: F(0) = -sqrt(mu) * dt, so the root lies between 0 and a chi of the time step's sign
+    bound = chi if chi * direction > 0 else root_mu * time_step / r0
+    while kepler_function(bound)[0] * direction < 0:
+        bound *= 2
+    low, high = sorted((0.0, bound))
+    chi = min(max(chi, low), high)
+
+    for _ in range(max_iterations):
+        function, derivative = kepler_function(chi)
+        if function == 0:
+            break
+        if function < 0:
+            low = chi
+        else:
+            high = chi
+
+        new_chi = chi - function / derivative if np.isfinite(function) and derivative > 0 else np.nan
+        #a Newton step outside the bracket (or from an overflowing point) is replaced by bisection
+        if not low < new_chi < high:
+            new_chi = (low + high) / 2
+        correction = new_chi - chi
+        chi = new_chi
+        if abs(correction) < tolerance * max(1.0, abs(chi)):
+            break
+    else:
+        raise RuntimeError(f"Kepler solver did not converge in {max_iterations} iterations (time step {time_step} s)")
+
+    z = alpha * chi * chi
+    c, s = stumpff_c(z), stumpff_s(z)
+
+    f = 1 - chi * chi / r0 * c
+    g = time_step - np.power(chi, 3) / root_mu * s
+    new_position = f * position + g * velocity
+
+    r = np.linalg.norm(new_position)
+    f_dot = root_mu / (r * r0) * (z * chi * s - chi)
+    g_dot = 1 - chi * chi / r * c
+    new_velocity = f_dot * position + g_dot * velocity
+
+    return new_position, new_velocity
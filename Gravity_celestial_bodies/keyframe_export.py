@@ -0,0 +1,86 @@
+import json
+import numpy as np
+
+from trajectory_file import TrajectoryReader
+
+"""Keyframe export of gravity trajectories for Blender
+A run is exported as two files:
+    <path>.keys - raw little endian float32 keyframes, body by body: (bodies, frames, 3)
+    <path>.json - sidecar: body names, units, frame rate, first frame, frame count
+The recorded positions are resampled (linear interpolation) onto the animation
+frames and written one body at a time, so a run read from a trajectory file
+is streamed from disk and never has to fit in RAM.
+
+Reading it back (e.g. in Blender's python console):
+    keys = np.fromfile(path + ".keys", dtype="<f4").reshape(len(names), frames, 3)"""
+
+def sidecar_path(path: str):
+    return path + ".json"
+
+def keyframe_path(path: str):
+    return path + ".keys"
+
+def frame_times(times, frame_rate: float, duration: float | None = None):
+    """Simulated time (s) shown on every animation frame
+    duration - animation length (s), by default one frame per recorded position"""
+    frames = len(times) if duration is None else max(int(round(duration * frame_rate)) + 1, 2)
+    return np.linspace(times[0], times[-1], frames)
+
+def export_keyframes(path: str, times, names: list[str], body_positions, frame_rate: float = 24,
+                     duration: float | None = None, scale: float = 1e-3, frame_start: int = 1):
+    """Write the keyframes of every body
+    times - (records,) time of every recorded position (s)
+    body_positions - sequence of (records, 2 or 3) positions (1000 km), one per body, read lazily
+    scale - Blender units per 1000 km (default 1 unit = 1 million km)"""
+    times = np.asarray(times, dtype=float)
+    samples = frame_times(times, frame_rate, duration)
+    keys = np.empty((len(samples), 3), dtype="<f4")
+
+    with open(keyframe_path(path), "wb") as file:
+        for positions in body_positions:
+            positions = np.asarray(positions)
+            keys[:, positions.shape[1]:] = 0.0 #2D runs lie in the xy plane
+            for axis in range(positions.shape[1]):
+                keys[:, axis] = np.interp(samples, times, positions[:, axis]) * scale
+            file.write(keys.tobytes())
+
+    sidecar = {"names": list(names),
+               "frames": len(samples),
+               "frame_rate": frame_rate,
+               "frame_start": frame_start,
+               "dtype": "float32",
+               "byteorder": "little",
+               "layout": "bodies, frames, xyz",
+               "units": {"position": f"{1 / scale:g} * 1000 km", "time": "s"},
+               "time_start": float(samples[0]),
+               "time_per_frame": float(samples[1] - samples[0]) if len(samples) > 1 else 0.0}
+    with open(sidecar_path(path), "w") as file:
+        json.dump(sidecar, file, indent=2)
+
+def export_simulation(sim, path: str, **kwargs):
+    """Keyframes of a Simulation's in memory trajectories"""
+    export_keyframes(path, sim.time_data, [body.name for body in sim.bodies],
+                     (body.position_data for body in sim.bodies), **kwargs)
+
+def recorded_bodies(reader: TrajectoryReader, block_bytes: int = 256 * 2 ** 20):
+    """Positions of one body after another from a trajectory file
+    The file is stored frame by frame, so bodies are read in blocks of up to block_bytes
+    to pass over the file a few times instead of once per body"""
+    positions = reader.positions
+    block = max(1, block_bytes // max(1, len(reader) * reader.dimensions * 8))
+    for start in range(0, len(reader.names), block):
+        bodies = np.array(positions[:, start:start + block])
+        for index in range(bodies.shape[1]):
+            yield bodies[:, index]
+
+def export_recording(recording: str, path: str, **kwargs):
+    """Keyframes of a run recorded with Simulation.record_to, streamed from the trajectory file"""
+    reader = TrajectoryReader(recording)
+    export_keyframes(path, reader.times, reader.names, recorded_bodies(reader), **kwargs)
+
+def load_keyframes(path: str):
+    """(sidecar, keyframes (bodies, frames, 3)) of an exported run"""
+    with open(sidecar_path(path)) as file:
+        sidecar = json.load(file)
+    keys = np.fromfile(keyframe_path(path), dtype="<f4")
+    return sidecar, keys.reshape(len(sidecar["names"]), sidecar["frames"], 3)
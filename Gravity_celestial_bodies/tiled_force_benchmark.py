@@ -0,0 +1,47 @@
+import os
+import time
+import numpy as np
+from Gravity_simulation_3D import CelestialBody, Simulation
+
+"""Benchmark: scaling of the tiled direct solver with the number of threads
+One force evaluation of a random star cluster, best of a few repeats"""
+
+solar_mass = 2e30 #kg
+
+def make_cluster(body_count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    positions = rng.normal(scale=100000, size=(body_count, 3)) #1000 km
+    masses = rng.uniform(0.1, 10, body_count) * solar_mass
+
+    return [CelestialBody(mass, position, np.zeros(3)) for mass, position in zip(masses, positions)]
+
+def time_forces(sim: Simulation, repeats: int = 3):
+    """Best wall time of one force evaluation (seconds)"""
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        sim.update_gravity()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    tile_size = 256
+    cores = os.cpu_count()
+    worker_counts = sorted({1, 2, 4, 8, cores})
+
+    print(f"cores: {cores}, tile size: {tile_size}")
+    print(f"{'bodies':>7} {'workers':>8} {'time (s)':>9} {'speedup':>8}")
+
+    for body_count in (5000, 20000):
+        bodies = make_cluster(body_count)
+        reference = None
+
+        for workers in worker_counts:
+            sim = Simulation(bodies, workers=workers, tile_size=tile_size)
+            wall_time = time_forces(sim)
+            if reference is None:
+                reference = wall_time
+            print(f"{body_count:>7} {workers:>8} {wall_time:>9.3f} {reference / wall_time:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import json
+import os
+import numpy as np
+
+"""Streaming trajectory files for long gravity runs
+A run is stored as two files:
+    <path>.bin  - raw float64 frames, one row per frame: [time, x0, y0, z0, x1, ...]
+    <path>.json - small header: body names, units, dimensions, record stride, frame count
+Frames are written in chunks while the simulation runs, and read back lazily
+through a memory map, so runs never have to fit in RAM."""
+
+UNITS = {"time": "s", "position": "1000 km"}
+
+def header_path(path: str):
+    return path + ".json"
+
+def data_path(path: str):
+    return path + ".bin"
+
+class TrajectoryRecorder:
+    def __init__(self, path: str, names: list[str], dimensions: int, record_every: int = 1,
+                 chunk_frames: int = 1024, frames: int = 0):
+        """path - file name without extension
+        names - body names (one per body, in simulation order)
+        chunk_frames - frames kept in memory before they are written out
+        frames - frames already in the file to keep (resume), 0 starts a new file"""
+        self.path = path
+        self.names = list(names)
+        self.dimensions = dimensions
+        self.record_every = record_every
+        self.row_size = 1 + len(self.names) * dimensions
+
+        self.chunk = np.empty((chunk_frames, self.row_size))
+        self.chunk_length = 0
+
+        #frames already flushed to disk
+        self.frames = frames
+        if frames:
+            #drop anything written after the kept frames
+            with open(data_path(path), "r+b") as file:
+                file.truncate(frames * self.row_size * 8)
+            self.file = open(data_path(path), "ab")
+        else:
+            self.file = open(data_path(path), "wb")
+
+        self.write_header()
+
+    def write_header(self):
+        header = {"names": self.names,
+                  "dimensions": self.dimensions,
+                  "record_every": self.record_every,
+                  "frames": self.frames,
+                  "dtype": "float64",
+                  "units": UNITS}
+        with open(header_path(self.path), "w") as file:
+            json.dump(header, file, indent=2)
+
+    def write(self, time: float, positions):
+        """Add one frame, positions (N, 3)"""
+        self.chunk[self.chunk_length, 0] = time
+        self.chunk[self.chunk_length, 1:] = np.ravel(positions)
+        self.chunk_length += 1
+
+        if self.chunk_length == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered frames to disk"""
+        if self.chunk_length:
+            self.file.write(self.chunk[:self.chunk_length].tobytes())
+            self.file.flush()
+            self.frames += self.chunk_length
+            self.chunk_length = 0
+            self.write_header()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class TrajectoryReader:
+    def __init__(self, path: str):
+        """Open a recorded run lazily (nothing is loaded until it is indexed)"""
+        with open(header_path(path)) as file:
+            self.header = json.load(file)
+
+        self.names = self.header["names"]
+        self.dimensions = self.header["dimensions"]
+        self.units = self.header["units"]
+        self.record_every = self.header["record_every"]
+
+        row_size = 1 + len(self.names) * self.dimensions
+        #the file size is authoritative: a run that was interrupted may have more frames than the header
+        self.frames = os.path.getsize(data_path(path)) // (row_size * 8)
+
+        self.data = np.memmap(data_path(path), dtype=np.float64, mode="r", shape=(self.frames, row_size))
+
+    def __len__(self):
+        return self.frames
+
+    @property
+    def times(self):
+        """(frames,) view of the recorded times (s)"""
+        return self.data[:, 0]
+
+    @property
+    def positions(self):
+        """(frames, N, 3) view of the recorded positions (1000 km)"""
+        return self.data[:, 1:].reshape(self.frames, len(self.names), self.dimensions)
+
+    def body(self, name: str):
+        """(frames, 3) view of one body's positions"""
+        return self.positions[:, self.names.index(name)]
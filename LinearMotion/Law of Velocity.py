@@ -1,9 +1,14 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
 from matplotlib.animation import FuncAnimation, writers
 from matplotlib import style
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Plotting"))
+from parallel_export import export_animation
+
 """
 law of velocity
 v(t) = v0 + a * t
@@ -94,6 +99,10 @@ ani1 = FuncAnimation(fig,
                      interval = 25, 
                      repeat = False)
 
+#save with --save (rendered on every core)
+if "--save" in sys.argv:
+    export_animation("LinearMotion/Velocity_time.gif", fig, update, len(time)+10, fps = 1000 / 25, init = init)
+
 plt.show()
 plt.close(fig)
 
@@ -144,10 +153,8 @@ ani2 = FuncAnimation(fig,
                      interval = 20,
                      repeat = False)
 
+if "--save" in sys.argv:
+    export_animation("LinearMotion/Distance_area.gif", fig, update_fill, 110, fps = 1000 / 20)
+
 plt.show()
 plt.close(fig)
-
-# Save the animations:
-
-#ani1.save("LinearMotion/Velocity_time.gif")
-#ani2.save("LinearMotion/Distance_area.gif")
@@ -1,3 +1,6 @@
+import os
+import sys
+from collections import deque
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
@@ -5,29 +8,121 @@ from matplotlib.patches import Rectangle, FancyArrow
 
 from falling_object import FallingObject
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Result_cache"))
+from result_cache import ResultCache, cache_key, code_version
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Plotting"))
+from frame_sampler import HermiteTrajectory, frame_times, hermite_step
+from parallel_export import export_animation
+from follow_camera import FollowCamera
+
 class Simulation:
     plt.style.use("dark_background")
 
-    def __init__(self, mass, height, length, time_interval: float):
+    def __init__(self, mass, height, length, time_interval: float, frame_rate: float = 60, cache: ResultCache | None = None,
+                 stream: bool = False, lookahead: int = 120):
+        """time_interval - integration step (s), the frames are interpolated from the steps at frame_rate (fps)
+        cache - reuse the fall data of a previous run with the same inputs and code
+        stream - do not simulate up front: the fall is stepped as the animation asks for frames,
+        at most `lookahead` frames ahead (the velocity graph still needs the whole fall)"""
+        self.mass = mass
+        self.height = height
         self.length = length
         self.time_interval = time_interval
+        self.frame_rate = frame_rate
+        self.cache = cache
+        self.stream = stream
+        self.lookahead = lookahead
+
+        #forces at the frame times come from the object's drag model
+        self.falling_object = FallingObject(mass, height, length=length)
+
+        self.time_data = None
+        if not stream:
+            self.simulate()
+
+    def simulate(self):
+        """Run the whole fall and keep every step"""
+        falling_object = FallingObject(self.mass, self.height, length=self.length)
+
+        #the force data comes from the loop below, so this script is part of the key too
+        key = cache_key(self.mass, self.height, self.length, self.time_interval, code_version(Simulation, FallingObject))
+        cached = self.cache.get_arrays(key) if self.cache is not None else None
+        if cached is not None:
+            self.force_data = cached["force_data"]
+            self.position_data = cached["position_data"]
+            self.time_data = cached["time_data"]
+            self.velocity_data = cached["velocity_data"]
+            trajectory = HermiteTrajectory(self.time_data, self.position_data, cached["trajectory_velocities"])
+        else:
+            #simulate the falling object
+            self.force_data = []
+
+            while falling_object.position[1] > 0:
+                falling_object.update_position(self.time_interval)
+                #add the force_data (gravity, drag)
+                self.force_data.append((falling_object.weight_force, falling_object.drag_force))
+
+            #extract stored data
+            self.force_data = np.array(self.force_data)
+            self.position_data = falling_object.position_data
+            self.time_data = falling_object.time_data
+            self.velocity_data = falling_object.velocity_data
+            trajectory = falling_object.dense_output()
+
+            if self.cache is not None:
+                self.cache.put_arrays(key, force_data=self.force_data, position_data=self.position_data,
+                                      time_data=self.time_data, velocity_data=self.velocity_data,
+                                      trajectory_velocities=trajectory.velocities)
+
+        self.height_data = self.position_data[:, 1]
+
+        #the animation samples the steps at its own frame times
+        self.trajectory = trajectory
+        self.frame_times = frame_times(self.time_data[0], self.time_data[-1], self.frame_rate)
+
+    def stream_frames(self):
+        """Generator of (time, position, velocity) at the frame times, stepping a fresh fall only as far
+        as the frames need. Frames are computed in batches of up to `lookahead`, and neither the steps
+        nor the frames are kept"""
+        falling_object = FallingObject(self.mass, self.height, length=self.length, keep_in_memory=False)
+        previous = (falling_object.time, falling_object.position, falling_object.velocity)
+        window = deque()
+        frame = 0
+        finished = False
+
+        while not finished or window:
+            #fill the window: interpolate the frames inside the current step, otherwise take a step
+            while not finished and len(window) < self.lookahead:
+                time = frame / self.frame_rate
+                landed = falling_object.impact_time is not None
+                if landed and time >= falling_object.time:
+                    #the last frame shows the impact
+                    window.append((falling_object.time, falling_object.position, falling_object.impact_velocity))
+                    finished = True
+                elif time <= falling_object.time:
+                    window.append(self.interpolate(previous, falling_object, time))
+                    frame += 1
+                else:
+                    previous = (falling_object.time, falling_object.position, falling_object.velocity)
+                    falling_object.update_position(self.time_interval)
+
+            if window:
+                yield window.popleft()
+
+    def interpolate(self, previous, falling_object, time: float):
+        """(time, position, velocity) between the previous step and the object's current state"""
+        start_time, start_position, start_velocity = previous
+        step = falling_object.time - start_time
+        if step == 0:
+            return time, falling_object.position, falling_object.velocity
+
+        #the impact zeroes the velocity, the curve keeps the impact velocity instead
+        end_velocity = falling_object.impact_velocity if falling_object.impact_time is not None else falling_object.velocity
+        position, derivative = hermite_step((time - start_time) / step, start_position, falling_object.position,
+                                            start_velocity * step, end_velocity * step)
+        return time, position, derivative / step
 
-        #simulate the falling object
-        falling_object = FallingObject(mass, height, length=length)
-        self.force_data = []
-
-        while falling_object.position[1] > 0:
-            falling_object.update_position(time_interval)
-            #add the force_data (gravity, drag)
-            self.force_data.append((falling_object.weight_force, falling_object.drag_force))
-        
-        #extract stored data
-        self.force_data = np.array(self.force_data)
-        self.height_data = np.array([pos[1] for pos in falling_object.position_data])
-        self.time_data = falling_object.time_data
-        self.velocity_data = falling_object.velocity_data
-
-    
     def initial_graph(self):
         #Set up the figure and axis
         self.fig, self.ax = plt.subplots(dpi = 100)
@@ -37,66 +132,80 @@ class Simulation:
         self.ax.set_ylabel("Altitude (m)")
         self.ax.grid(color = "#999999", alpha = 0.2)
 
-        #set the limits to only see the object directly
-        self.ax.set_xlim(-1, 1)
-        self.ax.set_ylim(self.height_data[0] - 1, self.height_data[0]+1)
+        #the camera follows the object down, the limits only show the object directly
+        self.camera = FollowCamera(self.ax, 2, 2, spacing = 0.5, follow = "y", grid = {"color": "#999999", "alpha": 0.2})
+        self.camera.move_to(0, self.height)
 
         #add a ground plane:
-        self.ax.plot((-10, 10), (0, 0), color = "grey")
+        self.ground, = self.camera.add(*self.ax.plot((-10, 10), (0, 0), color = "grey"))
 
         #Create the rectangle
-        self.rectangle = Rectangle((-self.length/2, self.height_data[0]), 
+        self.rectangle = Rectangle((-self.length/2, self.height), 
                                    self.length, self.length,
                                    color = "white")
 
         self.ax.add_patch(self.rectangle)
 
         #Create the arrow objects:
-        self.weight_arrow = FancyArrow(0, self.height_data[0], 0, self.force_data[0][0][1]/20, color = 'lime', 
+        self.weight_arrow = FancyArrow(0, self.height, 0, self.falling_object.weight_force[1]/20, color = 'lime', 
                                        width=0.02, head_width=0.05, length_includes_head=True)
-        self.drag_arrow = FancyArrow(0, self.height_data[0]+self.length, 0, 0, color = 'red', 
+        self.drag_arrow = FancyArrow(0, self.height+self.length, 0, 0, color = 'red', 
                                      width=0.02, head_width=0.05, length_includes_head=True)
         
         self.ax.add_patch(self.weight_arrow)
         self.ax.add_patch(self.drag_arrow)
+        self.camera.add(self.rectangle, self.weight_arrow, self.drag_arrow)
 
-        #Add text:
-        self.force_text = self.ax.text(-0.9, self.height_data[0]+0.6, "")
-        self.start_data = self.ax.text(0.9, self.height_data[0]+0.6, "mass: 1 kg\nsize: 10 cm\ndrop altitude: 750 m", horizontalalignment = 'right')
+        #Add text (fixed on screen, next to the object):
+        self.force_text = self.ax.text(-0.7, 0.6, "")
+        self.start_data = self.ax.text(0.9, 0.6, "mass: 1 kg\nsize: 10 cm\ndrop altitude: 750 m", horizontalalignment = 'right')
 
         self.fig.savefig("Object_under_gravity/graphics/initial_graph.png")
 
     def update_frame(self, frame):
-        """Update rectangle position, arrows and text for each frame"""
+        """Update rectangle position, arrows and text for each frame
+        frame - frame index, or the (time, position, velocity) of stream_frames in streaming mode"""
+        #state at the frame time, interpolated between the simulation steps
+        if self.stream:
+            _, position, velocity = frame
+        else:
+            position, velocity = self.trajectory(self.frame_times[frame])
+        height = position[1]
+
         #update x y coordinates
-        self.rectangle.set_xy((-self.length/2, self.height_data[frame]))
+        self.rectangle.set_xy((-self.length/2, height))
 
         #update the gravity arrow
-        weight_force = self.force_data[frame][0][1]
-        self.weight_arrow.set_data(x=0, y=self.height_data[frame], dx=0, dy=weight_force / 20) # /20 for visualisation
+        weight_force = self.falling_object.weight_force[1]
+        self.weight_arrow.set_data(x=0, y=height, dx=0, dy=weight_force / 20) # /20 for visualisation
 
         #update the drag arrow
-        drag_force = self.force_data[frame][1][1]
-        self.drag_arrow.set_data(x=0, y=self.height_data[frame]+self.length, dx=0, dy=drag_force / 20)
+        drag_force = self.falling_object.drag(velocity, height)[1]
+        self.drag_arrow.set_data(x=0, y=height+self.length, dx=0, dy=drag_force / 20)
         
-        #update the limit
-        self.ax.set_ylim(self.height_data[frame] - 1, self.height_data[frame]+1)
-
-        #update the text placement
-        self.force_text.set_position(xy= (-0.9, self.height_data[frame]+0.6))
-        self.force_text.set_text(f"Weight: {np.abs(weight_force):.2f} N\nDrag: {np.abs(drag_force):.2f} N\nVelocity: {np.abs(self.velocity_data[frame][1]):.2f} m/s")
+        #follow the object, the view limits stay the same so the background can be blitted
+        camera_artists = self.camera.move_to(0, height)
 
-        self.start_data.set_position(xy = (0.9, self.height_data[frame]+0.6))
+        #update the text
+        self.force_text.set_text(f"Weight: {np.abs(weight_force):.2f} N\nDrag: {np.abs(drag_force):.2f} N\nVelocity: {np.abs(velocity[1]):.2f} m/s")
 
-        return (self.rectangle, self.weight_arrow, self.drag_arrow)
+        return (self.ground, self.rectangle, self.weight_arrow, self.drag_arrow, self.force_text) + camera_artists
     
-    def animate(self):
+    def animate(self, workers: int | None = None, preview_every: int = 1):
+        """Save the animation as a gif and show it
+        workers - processes rendering the gif (all cores by default), preview_every - only save every n-th frame"""
         self.initial_graph()
 
-        #create the animation
-        frames = len(self.force_data)
-        ani = FuncAnimation(self.fig, self.update_frame, frames, interval = self.time_interval * 1000, repeat = True)
-        ani.save("Object_under_gravity/graphics/fall_animation.gif", fps = 60, dpi=200)
+        #create the animation, streamed frames are produced while it plays and not cached
+        if self.stream:
+            ani = FuncAnimation(self.fig, self.update_frame, self.stream_frames, interval = 1000 / self.frame_rate,
+                                repeat = True, cache_frame_data = False, blit = True)
+            ani.save("Object_under_gravity/graphics/fall_animation.gif", fps = self.frame_rate, dpi=200)
+        else:
+            frames = len(self.frame_times)
+            export_animation("Object_under_gravity/graphics/fall_animation.gif", self.fig, self.update_frame, frames,
+                             fps = self.frame_rate, dpi = 200, workers = workers, preview_every = preview_every)
+            ani = FuncAnimation(self.fig, self.update_frame, frames, interval = 1000 / self.frame_rate, repeat = True, blit = True)
 
         plt.show()
         plt.close()
@@ -104,18 +213,20 @@ class Simulation:
     def final_graph(self):
         self.initial_graph()
         self.rectangle.set_xy((-self.length/2, 0))
-        self.ax.set_ylim(-1,1)
+        self.camera.move_to(0, 0)
 
-        self.weight_arrow.set_data(x=0, y=0, dx=0, dy=self.force_data[-1][0][1] / 20)
+        self.weight_arrow.set_data(x=0, y=0, dx=0, dy=self.falling_object.weight_force[1] / 20)
         self.drag_arrow.set_data(x=0, y=1, dx=0, dy=0)
 
-        self.ax.text(0.9, self.height_data[-1]+0.6, "mass: 1 kg\nsize: 10 cm\ndrop altitude: 750 m", horizontalalignment = 'right')
-
         self.fig.savefig("Object_under_gravity/graphics/final_graph.png")
         plt.show()
         plt.close()
 
     def velocity_graph(self):
+        #the graph needs every step, run the fall if it was only streamed
+        if self.time_data is None:
+            self.simulate()
+
         #Set up the figure and axis
         fig, ax = plt.subplots(dpi = 100)
 
@@ -135,7 +246,9 @@ class Simulation:
         plt.show()
 
 
-sim = Simulation(mass = 1, height = 750, length = 0.1, time_interval = 0.05)
+#--cache reuses a previous run, --stream renders while simulating
+sim = Simulation(mass = 1, height = 750, length = 0.1, time_interval = 0.05,
+                 cache = ResultCache() if "--cache" in sys.argv else None, stream = "--stream" in sys.argv)
 sim.animate()
 sim.final_graph()
 sim.velocity_graph()
\ No newline at end of file
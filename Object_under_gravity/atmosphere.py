@@ -0,0 +1,77 @@
+import numpy as np
+
+"""International Standard Atmosphere (ISA) air density
+The atmosphere is made of layers with a constant temperature lapse rate,
+temperature and pressure follow from the layer base values:
+    lapse rate L != 0: T = T_b + L * (h - h_b),  p = p_b * (T_b / T)^(g0 / (R * L))
+    isothermal layer: T = T_b,                   p = p_b * exp(-g0 * (h - h_b) / (R * T_b))
+    density rho = p / (R * T)
+with h the geopotential altitude. The formula is evaluated once into a table
+(0-80 km every 10 m), simulations then only pay for a linear interpolation."""
+
+GRAVITY = 9.80665 #m/s^2, standard gravity
+GAS_CONSTANT = 287.053 #J/(kg*K), specific gas constant of dry air
+EARTH_RADIUS = 6356766 #m, for the geopotential altitude
+
+#layer base geopotential altitude (m) and temperature lapse rate (K/m), up to 84.852 km
+LAYERS = np.array([[0, -0.0065],
+                   [11000, 0.0],
+                   [20000, 0.001],
+                   [32000, 0.0028],
+                   [47000, 0.0],
+                   [51000, -0.0028],
+                   [71000, -0.002]])
+SEA_LEVEL_TEMPERATURE = 288.15 #K
+SEA_LEVEL_PRESSURE = 101325 #Pa
+
+def layer_bases():
+    """Temperature (K) and pressure (Pa) at the base of every layer"""
+    temperatures = [SEA_LEVEL_TEMPERATURE]
+    pressures = [SEA_LEVEL_PRESSURE]
+    for (base, lapse_rate), (top, _) in zip(LAYERS[:-1], LAYERS[1:]):
+        temperature, pressure = layer_state(top - base, temperatures[-1], pressures[-1], lapse_rate)
+        temperatures.append(temperature)
+        pressures.append(pressure)
+    return np.array(temperatures), np.array(pressures)
+
+def layer_state(height, base_temperature, base_pressure, lapse_rate):
+    """Temperature and pressure at `height` (m) above the base of a layer"""
+    if lapse_rate == 0:
+        return (np.full_like(np.asarray(height, dtype=float), base_temperature),
+                base_pressure * np.exp(-GRAVITY * height / (GAS_CONSTANT * base_temperature)))
+    temperature = base_temperature + lapse_rate * height
+    return temperature, base_pressure * np.power(base_temperature / temperature, GRAVITY / (GAS_CONSTANT * lapse_rate))
+
+def isa_density(altitudes):
+    """Air density (kg/m^3) at geometric altitudes (m), evaluated from the layer formulas"""
+    altitudes = np.asarray(altitudes, dtype=float)
+    geopotential = EARTH_RADIUS * altitudes / (EARTH_RADIUS + altitudes)
+    layer = np.clip(np.searchsorted(LAYERS[:, 0], geopotential, side="right") - 1, 0, len(LAYERS) - 1)
+
+    base_temperatures, base_pressures = layer_bases()
+    temperature = np.empty_like(geopotential)
+    pressure = np.empty_like(geopotential)
+    for index, (base, lapse_rate) in enumerate(LAYERS):
+        inside = layer == index
+        temperature[inside], pressure[inside] = layer_state(geopotential[inside] - base, base_temperatures[index],
+                                                            base_pressures[index], lapse_rate)
+    return pressure / (GAS_CONSTANT * temperature)
+
+class DensityTable:
+    def __init__(self, max_altitude: float = 80000, spacing: float = 10):
+        """ISA density tabulated from 0 to max_altitude (m) every `spacing` meters"""
+        self.spacing = spacing
+        self.altitudes = np.arange(0, max_altitude + spacing, spacing)
+        self.densities = isa_density(self.altitudes)
+        #density change to the next table entry, for the interpolation
+        self.slopes = np.append(np.diff(self.densities), 0.0)
+
+    def __call__(self, altitudes):
+        """Air density (kg/m^3) at altitudes (m), scalar or array
+        Linear interpolation on the uniform grid, clamped to the table range"""
+        position = np.clip(np.asarray(altitudes, dtype=float), 0, self.altitudes[-1]) / self.spacing
+        index = position.astype(int)
+        return self.densities[index] + (position - index) * self.slopes[index]
+
+#built once, shared by every simulation
+STANDARD_ATMOSPHERE = DensityTable()
@@ -0,0 +1,39 @@
+import time
+import numpy as np
+from falling_object import FallingObject, FallingBatch, simulate
+
+"""Benchmark: one FallingObject at a time against FallingBatch
+Random drops (mass, height, launch speed and angle, shape, size), same time step"""
+
+def make_drops(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return {"masses": rng.uniform(0.5, 5, count),
+            "heights": rng.uniform(50, 2000, count),
+            "velocities": rng.uniform(0, 30, count),
+            "velocity_angles": rng.uniform(0, 90, count),
+            "shapes": rng.choice(["cube", "sphere"], count),
+            "lengths": rng.uniform(0.05, 0.5, count)}
+
+def main():
+    time_interval = 0.01 #s
+    scalar_drops = 20
+
+    print(f"{'drops':>6} {'batch (s)':>10} {'one by one (s)':>15} {'speedup':>8}")
+    for count in (100, 1000, 10000):
+        drops = make_drops(count)
+
+        start = time.perf_counter()
+        FallingBatch(**drops).simulate(time_interval)
+        batch_time = time.perf_counter() - start
+
+        #a sample of the drops one by one, scaled up to all of them
+        start = time.perf_counter()
+        for index in range(scalar_drops):
+            obj = FallingObject(*(drops[key][index] for key in ("masses", "heights", "velocities", "velocity_angles", "shapes", "lengths")))
+            simulate(obj, time_interval)
+        scalar_time = (time.perf_counter() - start) / scalar_drops * count
+
+        print(f"{count:>6} {batch_time:>10.3f} {scalar_time:>15.3f} {scalar_time / batch_time:>8.1f}")
+
+if __name__ == "__main__":
+    main()
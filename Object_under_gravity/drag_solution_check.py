@@ -0,0 +1,70 @@
+import sys
+import time
+import numpy as np
+from falling_object import FallingObject, VerticalDrop, simulate
+
+"""Cross-check: closed-form quadratic drag solution against the Euler stepper
+For a few vertical drops and launches, the stepper's impact time, impact velocity
+and heights must converge to VerticalDrop as the time step shrinks (first order).
+Exits with status 1 when a tolerance below is not met"""
+
+#error ratio per decade of time step of a first order method (ideally 10)
+CONVERGENCE_RATIO = (7, 13)
+#largest errors allowed at the 0.001 s step: time (s), velocity (m/s), height (m)
+TOLERANCES = {"time": 5e-3, "velocity": 1e-3, "height": 0.1}
+
+DROPS = {"1 kg cube from 750 m": (1, 750, 0, 90, "cube", 0.1),
+         "sphere launched up at 20 m/s": (1, 750, 20, 90, "sphere", 0.1),
+         "cube thrown down above terminal velocity": (1, 750, 100, -90, "cube", 0.1),
+         "light cube from 100 m": (0.05, 100, 0, 90, "cube", 0.3)}
+
+def check(name: str, errors: dict):
+    """Failure messages of one drop, errors maps each quantity to its errors at the steps 0.1, 0.01, 0.001"""
+    failures = []
+    for quantity, values in errors.items():
+        if values[-1] > TOLERANCES[quantity]:
+            failures.append(f"{name}: {quantity} error {values[-1]:.2e} above {TOLERANCES[quantity]:.0e}")
+        #the velocity of a drop at terminal velocity is exact to rounding, there is nothing to converge
+        if values[-1] < 1e-9:
+            continue
+        for coarse, fine in zip(values[:-1], values[1:]):
+            if not CONVERGENCE_RATIO[0] <= coarse / fine <= CONVERGENCE_RATIO[1]:
+                failures.append(f"{name}: {quantity} error ratio {coarse / fine:.2f} is not first order")
+    return failures
+
+def main():
+    failures = []
+    for name, parameters in DROPS.items():
+        start = time.perf_counter()
+        drop = VerticalDrop(FallingObject(*parameters))
+        exact_time = time.perf_counter() - start
+
+        sample_times = np.linspace(0, drop.impact_time, 50)
+        heights, _ = drop(sample_times)
+
+        print(f"{name}: fall time {drop.fall_time:.4f} s, impact velocity {drop.impact_velocity:.4f} m/s ({exact_time * 1e3:.2f} ms)")
+        print(f"{'step (s)':>9} {'time error (s)':>15} {'velocity error':>15} {'height error (m)':>17} {'time (s)':>9}")
+
+        errors = {"time": [], "velocity": [], "height": []}
+        for time_interval in (0.1, 0.01, 0.001):
+            obj = FallingObject(*parameters)
+            start = time.perf_counter()
+            simulate(obj, time_interval)
+            step_time = time.perf_counter() - start
+
+            step_heights = obj.dense_output()(sample_times)[0][:, 1]
+            errors["time"].append(abs(obj.impact_time - drop.fall_time))
+            errors["velocity"].append(abs(obj.impact_velocity[1] - drop.impact_velocity))
+            errors["height"].append(np.max(np.abs(step_heights - heights)))
+            print(f"{time_interval:>9} {errors['time'][-1]:>15.2e} {errors['velocity'][-1]:>15.2e} "
+                  f"{errors['height'][-1]:>17.2e} {step_time:>9.3f}")
+        print()
+        failures += check(name, errors)
+
+    for failure in failures:
+        print("FAILED", failure)
+    print("cross-check failed" if failures else "cross-check passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,40 @@
+import copy
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Plotting"))
+from trajectory_plot import downsample
+from frame_sampler import HermiteTrajectory, hermite_step, locate_crossing
+from atmosphere import STANDARD_ATMOSPHERE
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Result_cache"))
+from result_cache import write_npz
+
+def air_density_model(atmosphere: str):
+    """Air density (kg/m^3) as a function of altitude (m):
+    "constant" - sea level density everywhere, "isa" - International Standard Atmosphere table (0-80 km)"""
+    match atmosphere:
+        case "constant":
+            return None
+        case "isa":
+            return STANDARD_ATMOSPHERE
+        case _:
+            print("Invalid atmosphere type. Defaulting to constant...")
+            return None
+
+def drag_properties(shape: str, length: float):
+    """Cross sectional area (m^2) and drag coefficient of a shape with the given length (m)"""
+    match shape:
+        case "cube":
+            return np.power(length, 2), 1.05
+        case "sphere":
+            return np.pi * np.power(length/2, 2), 0.47
+        case _:
+            print("Invalid shape type. Defaulting to cube...")
+            return np.power(length, 2), 1.05
+
 class FallingObject:
     """
     simulate iteratively an object with mass falling from a height
@@ -11,9 +45,13 @@ class FallingObject:
     to do: visualisation
     """
     GRAVITY = 9.81 #m/s^2
+    AIR_DENSITY = 1.225 #kg/m^3
 
-    def __init__(self, mass: float, height: float, velocity = 0, velocity_angle = 90, shape = "cube", length = 1):
-        """Initialise the simulation with the mass(kg), height(m), velocity(m/s) at an angle(degrees), object shape and length"""
+    def __init__(self, mass: float, height: float, velocity = 0, velocity_angle = 90, shape = "cube", length = 1,
+                 atmosphere: str = "constant", keep_in_memory: bool = True):
+        """Initialise the simulation with the mass(kg), height(m), velocity(m/s) at an angle(degrees), object shape and length
+        atmosphere - air density model, "constant" (1.225 kg/m^3) or "isa" (density falls with altitude)
+        keep_in_memory - store every step (False keeps only the current state)"""
         self.mass = mass
         # position is a vector r = [0, y]
         self.position = np.array([0.0, height])
@@ -26,24 +64,22 @@ class FallingObject:
                                   velocity * np.sin(velocity_angle/180 * np.pi)])
 
         # drag coefficient and area based on shape
-        match shape:
-            case "cube":
-                self.area = np.power(length, 2)
-                self.DRAG_COEFFICIENT = 1.05
-            case "sphere":
-                self.area = np.pi * np.power(length/2, 2)
-                self.DRAG_COEFFICIENT = 0.47
-            case _:
-                print("Invalid shape type. Defaulting to cube...")
-                self.area = np.power(length, 2)
-                self.DRAG_COEFFICIENT = 1.05
+        self.area, self.DRAG_COEFFICIENT = drag_properties(shape, length)
+
+        # air density as a function of height, None for a constant density
+        self.atmosphere = atmosphere
+        self.density_model = air_density_model(atmosphere)
 
 
         self.time = 0
+        #set when the object reaches the ground (see locate_impact)
+        self.impact_time = None
+        self.impact_velocity = None
         # set the acceleration vector a = [ax, ay]
         self.acceleration = np.array([0.0, 0.0])
 
         # set the data storage for plotting
+        self.keep_in_memory = keep_in_memory
         self.time_data = np.array([self.time])
         self.position_data = np.array([self.position])
         self.velocity_data = np.array([self.velocity])
@@ -55,6 +91,8 @@ class FallingObject:
                                   velocity * np.sin(velocity_angle/180 * np.pi)])
         
         self.time = 0
+        self.impact_time = None
+        self.impact_velocity = None
 
         self.time_data = np.array([self.time])
         self.position_data = np.array([self.position])
@@ -64,23 +102,33 @@ class FallingObject:
         """
         Calculate drag force according to the following formula:
         F_drag = 0.5 * rho * |v|^2 * C_d * A , where:
-            rho - aur density (~1,225 kg/m^3)
+            rho - air density (1.225 kg/m^3, or the ISA density at the current height)
             v - velocity of object relative to fluid
             C_d - coefficent of drag (depends on shape)
             A - cross sectional area
         """
-        rho = 1.225 #air density (kg/m^3)
+        self.drag_force = self.drag(self.velocity)
+
+    def air_density(self, height: float):
+        """Air density (kg/m^3) at a height (m)"""
+        if self.density_model is None:
+            return self.AIR_DENSITY
+        return self.density_model(height)
+
+    def drag(self, velocity, height: float | None = None):
+        """Drag force (N) at a given velocity (m/s) and height (m, the current height by default), see update_drag_force"""
+        rho = self.air_density(self.position[1] if height is None else height)
         # velocity magnitude = |v|
-        velocity_magnitude = np.linalg.norm(self.velocity)
+        velocity_magnitude = np.linalg.norm(velocity)
 
         if velocity_magnitude == 0:
-            self.drag_force = np.array([0.0, 0.0])
-        else:
-            drag_magnitude = 0.5 * rho * np.power(velocity_magnitude, 2) * self.DRAG_COEFFICIENT * self.area
-            # drag direction = - velocity angle (!Opposite of the velocity angle!)
-            drag_direction = -self.velocity / velocity_magnitude
-            # F drag = magnitude * direction
-            self.drag_force = drag_magnitude * drag_direction
+            return np.array([0.0, 0.0])
+
+        drag_magnitude = 0.5 * rho * np.power(velocity_magnitude, 2) * self.DRAG_COEFFICIENT * self.area
+        # drag direction = - velocity angle (!Opposite of the velocity angle!)
+        drag_direction = -velocity / velocity_magnitude
+        # F drag = magnitude * direction
+        return drag_magnitude * drag_direction
 
     def update_acceleration(self):
         """Update the acceleration based on net forces and Newton's second law: F = m*a"""
@@ -97,34 +145,314 @@ class FallingObject:
 
     def update_position(self, time_interval: float):
         """update the position using Euler's method: r = r"""
+        start_position, start_velocity = self.position, self.velocity
         self.update_velocity(time_interval)
         self.position = self.position + self.velocity * time_interval
 
         #stop when the object hits the ground
         if self.position[1] < 0:
-            self.position[1] = 0
+            self.locate_impact(start_position, start_velocity, time_interval)
             self.velocity = np.array([0.0, 0.0])
+            self.store_data()
+            return
 
         self.time += time_interval
         self.store_data()
 
+    def locate_impact(self, start_position, start_velocity, time_interval: float):
+        """Find where inside the last step the object reached the ground (event location):
+        the root of the step's Hermite curve height, instead of the end of the step.
+        Sets the impact time, position and velocity"""
+        fraction = locate_crossing(start_position[1], self.position[1],
+                                   start_velocity[1] * time_interval, self.velocity[1] * time_interval)
+        position, derivative = hermite_step(fraction, start_position, self.position,
+                                            start_velocity * time_interval, self.velocity * time_interval)
+
+        self.time += fraction * time_interval
+        self.position = np.array([position[0], 0.0])
+        self.impact_time = self.time
+        self.impact_velocity = derivative / time_interval
+
     def store_data(self):
         """Store the simulation data using np.append and np.vstack for 2d arrays""" 
+        if not self.keep_in_memory:
+            return
         self.time_data = np.append(self.time_data, self.time)
         # for 2D positions:
         self.position_data = np.vstack([self.position_data, self.position])
         # for 2D velocities:
         self.velocity_data = np.vstack([self.velocity_data, self.velocity])
 
-def simulate(object: FallingObject, time_interval: float):
+    def dense_output(self):
+        """Interpolant of the stored steps: position and velocity at any time (see frame_sampler)
+        The last step of a landed object ends with the impact velocity rather than the zeroed one"""
+        velocity_data = self.velocity_data
+        if self.impact_time is not None:
+            velocity_data = velocity_data.copy()
+            velocity_data[-1] = self.impact_velocity
+        return HermiteTrajectory(self.time_data, self.position_data, velocity_data)
+
+    def save_checkpoint(self, path: str):
+        """Save the object's state and stored steps (.npz, see write_npz)"""
+        state = {"mass": self.mass,
+                 "position": self.position,
+                 "velocity": self.velocity,
+                 "acceleration": self.acceleration,
+                 "weight_force": self.weight_force,
+                 "area": self.area,
+                 "drag_coefficient": self.DRAG_COEFFICIENT,
+                 "atmosphere": self.atmosphere,
+                 "keep_in_memory": self.keep_in_memory,
+                 "time": self.time,
+                 "time_data": self.time_data,
+                 "position_data": self.position_data,
+                 "velocity_data": self.velocity_data}
+        if self.impact_time is not None:
+            state["impact_time"] = self.impact_time
+            state["impact_velocity"] = self.impact_velocity
+
+        write_npz(path, state)
+
+    @classmethod
+    def load_checkpoint(cls, path: str):
+        """Rebuild a FallingObject from save_checkpoint, continuing bit-identically"""
+        data = np.load(path)
+
+        obj = cls(float(data["mass"]), 0, atmosphere=str(data["atmosphere"]) if "atmosphere" in data else "constant")
+        obj.position = data["position"]
+        obj.velocity = data["velocity"]
+        obj.acceleration = data["acceleration"]
+        obj.weight_force = data["weight_force"]
+        obj.area = float(data["area"])
+        obj.DRAG_COEFFICIENT = float(data["drag_coefficient"])
+        obj.time = float(data["time"])
+        obj.time_data = data["time_data"]
+        obj.position_data = data["position_data"]
+        obj.velocity_data = data["velocity_data"]
+        if "keep_in_memory" in data:
+            obj.keep_in_memory = bool(data["keep_in_memory"])
+        if "impact_time" in data:
+            obj.impact_time = float(data["impact_time"])
+            obj.impact_velocity = data["impact_velocity"]
+        return obj
+
+class FallingBatch:
+    """
+    Many independent falling objects stepped together in NumPy arrays,
+    with the same forces and Euler steps as FallingObject.
+    Every lane retires on its own when it reaches the ground.
+    """
+    GRAVITY = FallingObject.GRAVITY
+    AIR_DENSITY = FallingObject.AIR_DENSITY
+
+    def __init__(self, masses, heights, velocities = 0, velocity_angles = 90, shapes = "cube", lengths = 1,
+                 atmosphere: str = "constant"):
+        """Arrays (or scalars shared by every lane) of masses(kg), heights(m), velocities(m/s) at angles(degrees),
+        object shapes and lengths(m)
+        atmosphere - air density model shared by every lane, "constant" or "isa" (see FallingObject)"""
+        masses, heights, velocities, velocity_angles, lengths = np.broadcast_arrays(
+            *(np.asarray(value, dtype=float) for value in (masses, heights, velocities, velocity_angles, lengths)))
+        self.lanes = masses.size
+
+        self.masses = masses.ravel().copy()
+        # positions r = [x, y] per lane
+        self.positions = np.zeros((self.lanes, 2))
+        self.positions[:, 1] = heights.ravel()
+
+        # weight G = m*g
+        self.weight_forces = np.zeros((self.lanes, 2))
+        self.weight_forces[:, 1] = -self.masses * self.GRAVITY
+
+        angles = velocity_angles.ravel() / 180 * np.pi
+        self.velocities = np.stack([velocities.ravel() * np.cos(angles), velocities.ravel() * np.sin(angles)], axis=1)
+
+        shapes = [shapes] * self.lanes if isinstance(shapes, str) else list(shapes)
+        properties = np.array([drag_properties(shape, length) for shape, length in zip(shapes, lengths.ravel())])
+        self.areas, self.drag_coefficients = properties[:, 0], properties[:, 1]
+        self.density_model = air_density_model(atmosphere)
+
+        self.time = 0.0
+        self.steps = 0
+        #lanes still falling, then the time and velocity of each impact
+        self.active = self.positions[:, 1] > 0
+        self.fall_times = np.where(self.active, np.nan, 0.0)
+        self.impact_velocities = np.where(self.active[:, None], np.nan, self.velocities)
+
+    def step(self, time_interval: float):
+        """One Euler step (s) of every lane still in the air"""
+        lanes = np.flatnonzero(self.active)
+        velocities = self.velocities[lanes]
+
+        # F_drag = 0.5 * rho * |v|^2 * C_d * A, opposite to the velocity
+        speeds = np.sqrt(np.einsum("ij,ij->i", velocities, velocities))
+        densities = self.AIR_DENSITY if self.density_model is None else self.density_model(self.positions[lanes, 1])
+        drag_magnitudes = 0.5 * densities * np.power(speeds, 2) * self.drag_coefficients[lanes] * self.areas[lanes]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            drag_forces = np.where(speeds[:, None] > 0, -velocities / speeds[:, None] * drag_magnitudes[:, None], 0.0)
+
+        accelerations = (self.weight_forces[lanes] + drag_forces) / self.masses[lanes, None]
+        velocities = velocities + accelerations * time_interval
+        positions = self.positions[lanes] + velocities * time_interval
+
+        #retire the lanes that hit the ground, at the impact located inside the step (see FallingObject.locate_impact)
+        landed = np.flatnonzero(positions[:, 1] < 0)
+        if len(landed):
+            start_positions, start_velocities = self.positions[lanes[landed]], self.velocities[lanes[landed]]
+            fractions = locate_crossing(start_positions[:, 1], positions[landed, 1],
+                                        start_velocities[:, 1] * time_interval, velocities[landed, 1] * time_interval)
+            impact_positions, derivatives = hermite_step(fractions[:, None], start_positions, positions[landed],
+                                                         start_velocities * time_interval, velocities[landed] * time_interval)
+
+            hit = lanes[landed]
+            self.fall_times[hit] = self.time + fractions * time_interval
+            self.impact_velocities[hit] = derivatives / time_interval
+            positions[landed, 0] = impact_positions[:, 0]
+            positions[landed, 1] = 0
+            velocities[landed] = 0.0
+            self.active[hit] = False
+
+        self.time += time_interval
+        self.steps += 1
+
+        self.positions[lanes] = positions
+        self.velocities[lanes] = velocities
+
+    def simulate(self, time_interval: float, max_steps: int | None = None):
+        """Step until every lane reached the ground (or for max_steps)"""
+        while self.active.any() and (max_steps is None or self.steps < max_steps):
+            self.step(time_interval)
+
+def log_cosh(x):
+    """ln(cosh(x)) without overflow"""
+    x = np.abs(x)
+    return x + np.log1p(np.exp(-2 * x)) - np.log(2)
+
+def log_sinh(x):
+    """ln(sinh(x)) without overflow, x > 0"""
+    return x + np.log1p(-np.exp(-2 * x)) - np.log(2)
+
+class VerticalDrop:
+    """
+    Exact solution of a vertical fall (or vertical launch) with gravity and quadratic drag,
+    the FallingObject model with constant air density:
+        dv/dt = -g - k * v * |v|,  k = 0.5 * rho * C_d * A / m,  terminal velocity v_t = sqrt(g / k)
+    rising: v = v_t * tan(phi0 - g*t/v_t), falling: |v| = v_t * tanh(g*t/v_t + tau0)
+    (coth instead of tanh when starting faster than v_t), heights from the ln(cos) / ln(cosh) integrals.
+    """
+    def __init__(self, object: FallingObject):
+        """Start from the object's current time, height and vertical velocity"""
+        self.gravity = object.GRAVITY
+        k = 0.5 * object.AIR_DENSITY * object.DRAG_COEFFICIENT * object.area / object.mass
+        self.terminal_velocity = np.sqrt(self.gravity / k)
+        vt, g = self.terminal_velocity, self.gravity
+
+        self.start_time = object.time
+        self.start_height = object.position[1]
+        self.start_velocity = object.velocity[1]
+
+        #rising part of a vertical launch, up to the apex
+        self.rise_angle = np.arctan(max(self.start_velocity, 0.0) / vt)
+        self.apex_time = self.start_time + vt / g * self.rise_angle
+        self.apex_height = self.start_height + vt * vt / (2 * g) * np.log1p(np.power(max(self.start_velocity, 0.0) / vt, 2))
+
+        #falling part, downward speed u0 at the start of the fall
+        ratio = max(-self.start_velocity, 0.0) / vt
+        self.above_terminal = ratio > 1
+        self.fall_phase = np.arctanh(1 / ratio) if self.above_terminal else np.arctanh(min(ratio, 1 - 1e-15))
+
+        # solve distance fallen = apex height for the time of the impact
+        phase = log_sinh(self.fall_phase) if self.above_terminal else log_cosh(self.fall_phase)
+        level = phase + self.apex_height * g / (vt * vt)
+        if self.above_terminal:
+            end_phase = level + np.log1p(np.sqrt(1 + np.exp(-2 * level))) if level > 0 else np.arcsinh(np.exp(level))
+        else:
+            end_phase = level + np.log1p(np.sqrt(-np.expm1(-2 * level)))
+        self.impact_time = self.apex_time + vt / g * (end_phase - self.fall_phase)
+
+    @property
+    def fall_time(self):
+        """Time from the start to the impact (s)"""
+        return self.impact_time - self.start_time
+
+    @property
+    def impact_velocity(self):
+        """Vertical velocity at the impact (m/s)"""
+        return self(self.impact_time, stop=False)[1]
+
+    def __call__(self, times, stop: bool = True):
+        """(heights (m), vertical velocities (m/s)) at any times, resting on the ground after the impact"""
+        times = np.asarray(times, dtype=float)
+        vt, g = self.terminal_velocity, self.gravity
+
+        rising = times < self.apex_time
+        rise_angle = self.rise_angle - g * np.clip(times - self.start_time, 0, None) / vt
+        rise_heights = self.start_height + vt * vt / g * (np.log(np.cos(np.where(rising, rise_angle, 0)))
+                                                          - np.log(np.cos(self.rise_angle)))
+        rise_velocities = vt * np.tan(rise_angle)
+
+        fall_phase = self.fall_phase + g * np.clip(times - self.apex_time, 0, None) / vt
+        if self.above_terminal:
+            fallen = vt * vt / g * (log_sinh(fall_phase) - log_sinh(self.fall_phase))
+            fall_velocities = -vt / np.tanh(fall_phase)
+        else:
+            fallen = vt * vt / g * (log_cosh(fall_phase) - log_cosh(self.fall_phase))
+            fall_velocities = -vt * np.tanh(fall_phase)
+
+        heights = np.where(rising, rise_heights, self.apex_height - fallen)
+        velocities = np.where(rising, rise_velocities, fall_velocities)
+        if stop:
+            landed = times >= self.impact_time
+            heights = np.where(landed, 0.0, heights)
+            velocities = np.where(landed, 0.0, velocities)
+        return heights, velocities
+
+def solve_fall(object: FallingObject, sample_times=None, time_interval: float = 0.01):
+    """Fall time (s), impact velocity [v_x, v_y] (m/s) and, for sample_times, the (heights, velocities) there
+    Exact (VerticalDrop) for a vertical motion in a constant density, otherwise a copy of the object is
+    stepped with simulate() and sampled from its dense output; the object itself is never changed"""
+    if object.position[1] <= 0:
+        #already on the ground: no fall, resting at every sample time
+        samples = None
+        if sample_times is not None:
+            heights = np.zeros(np.shape(sample_times))
+            samples = (heights, np.zeros(heights.shape + (2,)))
+        return 0.0, object.velocity.copy(), samples
+
+    #launch angles of +-90 degrees leave a rounding error in v_x
+    vertical = abs(object.velocity[0]) <= 1e-12 * np.linalg.norm(object.velocity)
+    if vertical and object.density_model is None and object.area > 0:
+        drop = VerticalDrop(object)
+        samples = None
+        if sample_times is not None:
+            heights, vertical_velocities = drop(sample_times)
+            samples = (heights, np.stack([np.zeros_like(vertical_velocities), vertical_velocities], axis=-1))
+        return drop.fall_time, np.array([0.0, drop.impact_velocity]), samples
+
+    #the shared density table is not copied
+    stepped = copy.deepcopy(object, {id(object.density_model): object.density_model})
+    simulate(stepped, time_interval)
+    samples = None
+    if sample_times is not None:
+        positions, velocities = stepped.dense_output()(sample_times)
+        samples = (positions[..., 1], velocities)
+    return stepped.impact_time - object.time, stepped.impact_velocity, samples
+
+def simulate(object: FallingObject, time_interval: float, checkpoint_path: str | None = None, checkpoint_every: int = 1000):
+    """Step until the object reaches the ground
+    With a checkpoint_path the state is saved every checkpoint_every steps"""
+    steps = 0
     while object.position[1] > 0:
         object.update_position(time_interval)
+        steps += 1
+
+        if checkpoint_path is not None and steps % checkpoint_every == 0:
+            object.save_checkpoint(checkpoint_path)
 
-def visualise(object: FallingObject):
-    """visualise a trajectory in matplotlib"""
+def visualise(object: FallingObject, max_points: int = 4000):
+    """visualise a trajectory in matplotlib (downsampled to max_points)"""
     plt.style.use("dark_background")
 
-    positions = np.array(object.position_data)
+    positions = downsample(object.position_data, max_points)
 
     fig, ax = plt.subplots(figsize = (8,6))
 
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+
+"""Parameter sweep runner
+Fans independent simulation jobs (Simulation, FallingObject, Piston...) out over
+a process pool. Each job writes its result row straight into one shared
+(jobs, result_size) float64 array - shared memory, or a .npy memory map when
+a result path is given - so only a short status goes back through the pool.
+
+A job is a top level function job(parameters) -> 1D array of result_size values.
+Failed jobs keep a row of NaN and their error is reported, the rest carry on."""
+
+#the simulation folders are plain script directories
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("Gravity_celestial_bodies", "Object_under_gravity", "Four_Cycle_Engine"):
+    if os.path.join(ROOT, folder) not in sys.path:
+        sys.path.append(os.path.join(ROOT, folder))
+
+#per worker process: the result array, attached once by the pool initializer
+worker_results = None
+worker_memory = None
+
+def attach_results(name: str | None, path: str | None, shape: tuple):
+    """Pool initializer: open the shared result array in the worker"""
+    global worker_results, worker_memory
+    if path is not None:
+        worker_results = np.load(path, mmap_mode="r+")
+    else:
+        worker_memory = shared_memory.SharedMemory(name=name)
+        worker_results = np.ndarray(shape, dtype=np.float64, buffer=worker_memory.buf)
+
+def run_job(job, index: int, parameters):
+    """Run one job in a worker and write its row, returns (index, error or None)"""
+    try:
+        worker_results[index] = job(parameters)
+        return index, None
+    except Exception:
+        return index, traceback.format_exc(limit=3)
+
+def run_sweep(job, parameters: list, result_size: int, workers: int | None = None,
+              result_path: str | None = None, progress: bool = True):
+    """Run job(parameters[i]) for every i on `workers` processes
+    result_path - write the results to a .npy memory map instead of shared memory
+    Returns (results (jobs, result_size), errors {index: traceback})"""
+    shape = (len(parameters), result_size)
+    memory = None
+
+    if result_path is not None:
+        results = np.lib.format.open_memmap(result_path, mode="w+", dtype=np.float64, shape=shape)
+        results[:] = np.nan
+        results.flush()
+        initargs = (None, result_path, shape)
+    else:
+        memory = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+        results = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        results[:] = np.nan
+        initargs = (memory.name, None, shape)
+
+    errors = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_results, initargs=initargs) as executor:
+            futures = [executor.submit(run_job, job, index, values) for index, values in enumerate(parameters)]
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                index, error = future.result()
+                if error is not None:
+                    errors[index] = error
+                if progress:
+                    print(f"\r{done}/{len(futures)} jobs done, {len(errors)} failed", end="", flush=True)
+        if progress:
+            print()
+
+        if result_path is not None:
+            results.flush()
+            return np.load(result_path, mmap_mode="r"), errors
+        return results.copy(), errors
+    finally:
+        if memory is not None:
+            del results
+            memory.close()
+            memory.unlink()
+
+def scaling_report(job, parameters: list, result_size: int, max_workers: int | None = None):
+    """Run the same sweep on 1..max_workers processes and print wall time and speedup"""
+    max_workers = max_workers or os.cpu_count()
+    reference = None
+
+    print(f"{'workers':>8} {'time (s)':>9} {'speedup':>8}")
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        run_sweep(job, parameters, result_size, workers, progress=False)
+        wall_time = time.perf_counter() - start
+
+        if reference is None:
+            reference = wall_time
+        print(f"{workers:>8} {wall_time:>9.3f} {reference / wall_time:>8.2f}")
+
+"""Jobs for the simulations in this repository"""
+
+def gravity_job(parameters: dict):
+    """Final positions (N * 3) of a Simulation
+    parameters: masses, positions, velocities, time_step, steps and optionally integrator"""
+    from Gravity_simulation_3D import CelestialBody, Simulation
+
+    bodies = [CelestialBody(mass, position, velocity) for mass, position, velocity
+              in zip(parameters["masses"], parameters["positions"], parameters["velocities"])]
+    sim = Simulation(bodies, integrator=parameters.get("integrator", "euler"), keep_in_memory=False)
+    sim.simulate(parameters["time_step"], parameters["steps"])
+
+    return sim.positions.ravel()
+
+def falling_job(parameters: dict):
+    """[fall time (s), impact speed (m/s)] of a FallingObject
+    parameters: mass, height, length, time_interval and optionally velocity, angle, shape, atmosphere"""
+    from falling_object import FallingObject, simulate
+
+    obj = FallingObject(parameters["mass"], parameters["height"], parameters.get("velocity", 0),
+                        parameters.get("angle", 90), parameters.get("shape", "cube"), parameters["length"],
+                        parameters.get("atmosphere", "constant"))
+    simulate(obj, parameters["time_interval"])
+
+    return [obj.impact_time, np.linalg.norm(obj.impact_velocity)]
+
+def piston_job(parameters: dict):
+    """[work of one cycle (J)] of a Piston
+    parameters: stroke_length, bore_length, compression_ratio, cycle_time, stroke_timesteps"""
+    from Piston import Piston
+
+    piston = Piston(parameters["stroke_length"], parameters["bore_length"], parameters["compression_ratio"],
+                    parameters["cycle_time"], parameters.get("turbocharger", True))
+
+    return [piston.cycle_work(parameters["stroke_timesteps"])]
+
+def main():
+    """Example: drop table over masses and heights, then the scaling on this machine"""
+    drops = [{"mass": mass, "height": height, "length": 0.1, "time_interval": 0.01}
+             for mass in np.linspace(0.5, 5, 10) for height in np.linspace(100, 2000, 20)]
+
+    results, errors = run_sweep(falling_job, drops, result_size=2)
+    print(f"{len(drops) - len(errors)} drops simulated, {len(errors)} failed")
+    print(f"longest fall: {np.nanmax(results[:, 0]):.2f} s, fastest impact: {np.nanmax(results[:, 1]):.2f} m/s")
+
+    scaling_report(falling_job, drops, result_size=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import numpy as np
+import matplotlib
+from matplotlib import transforms
+from matplotlib.collections import LineCollection
+
+"""Follow camera for blitted animations
+Moving the axes limits every frame (ax.set_ylim) changes the view, so a blitting
+FuncAnimation has to throw away its cached background and redraw the whole figure,
+grid, ticks and text included. The camera keeps the limits fixed around (0, 0)
+and moves the world instead: followed artists are drawn through a translation
+(world - camera position) + ax.transData, and moving the camera only changes that
+translation. The grid lines and tick labels of the followed axes scroll with the
+world, so the camera draws them itself as a few animated artists inside the axes
+(blitting only redraws the inside of the axes), positioned at the multiples of
+`spacing` in view."""
+
+#tick marks and labels hidden on a followed axis
+TICK_SIDES = {"x": ("bottom", "top", "labelbottom", "labeltop"),
+              "y": ("left", "right", "labelleft", "labelright")}
+
+class FollowCamera:
+    def __init__(self, ax, width: float, height: float, spacing: float, follow: str = "xy",
+                 grid: dict | None = None, label_format: str = "{:g}"):
+        """ax - axes to film, width and height - visible span (data units)
+        spacing - distance between the grid lines / tick labels of the followed axes
+        follow - "x", "y" or "xy", the axes moving with the camera
+        grid - line properties of the moving grid, no grid when None"""
+        self.ax = ax
+        self.width = width
+        self.height = height
+        self.spacing = spacing
+        self.follow = follow
+        self.label_format = label_format
+        self.position = np.zeros(2)
+
+        #the view never changes, (0, 0) is the camera position
+        ax.set_xlim(-width / 2, width / 2)
+        ax.set_ylim(-height / 2, height / 2)
+
+        #world coordinates -> camera coordinates -> display
+        self.offset = transforms.Affine2D()
+        self.transform = self.offset + ax.transData
+
+        self.artists = []
+        self.grids = {}
+        self.labels = {}
+        for axis in follow:
+            #the static grid and tick labels would stand still, the camera draws its own
+            ax.grid(False, axis=axis)
+            ax.tick_params(axis=axis, which="both", **{side: False for side in TICK_SIDES[axis]})
+
+            if grid is not None:
+                self.grids[axis] = LineCollection([], **grid)
+                ax.add_collection(self.grids[axis])
+                self.artists.append(self.grids[axis])
+
+            #one label per grid line that can be in view
+            span = width if axis == "x" else height
+            self.labels[axis] = [self.label_text(axis) for _ in range(int(np.ceil(span / spacing)) + 1)]
+            self.artists.extend(self.labels[axis])
+
+    def label_text(self, axis: str):
+        """Tick label inside the axes, at the left (y) or bottom (x) edge"""
+        color = matplotlib.rcParams[f"{axis}tick.labelcolor"]
+        if color == "inherit":
+            color = matplotlib.rcParams[f"{axis}tick.color"]
+        size = matplotlib.rcParams[f"{axis}tick.labelsize"]
+
+        if axis == "x":
+            transform = transforms.blended_transform_factory(self.ax.transData, self.ax.transAxes)
+            return self.ax.text(0, 0.01, "", transform=transform, color=color, fontsize=size,
+                                horizontalalignment="center", verticalalignment="bottom")
+        transform = transforms.blended_transform_factory(self.ax.transAxes, self.ax.transData)
+        return self.ax.text(0.01, 0, "", transform=transform, color=color, fontsize=size,
+                            horizontalalignment="left", verticalalignment="center")
+
+    def add(self, *artists):
+        """Draw artists (in world coordinates) through the camera, returns them"""
+        for artist in artists:
+            artist.set_transform(self.transform)
+        return artists
+
+    def move_to(self, x: float, y: float):
+        """Centre the view on the world point (x, y) (only the followed coordinates are used)
+        Returns the camera's own artists, to add to the ones returned by the update function"""
+        self.position = np.array([x if "x" in self.follow else 0.0, y if "y" in self.follow else 0.0])
+        self.offset.clear().translate(*-self.position)
+
+        for axis in self.follow:
+            index = 0 if axis == "x" else 1
+            span = self.width if axis == "x" else self.height
+            centre = self.position[index]
+
+            #world values of the grid lines in view, and their camera coordinates
+            first = np.ceil((centre - span / 2) / self.spacing)
+            last = np.floor((centre + span / 2) / self.spacing)
+            values = np.arange(first, last + 1) * self.spacing
+            positions = values - centre
+
+            if axis in self.grids:
+                across = self.height / 2 if axis == "x" else self.width / 2
+                segments = [[(p, -across), (p, across)] if axis == "x" else [(-across, p), (across, p)] for p in positions]
+                self.grids[axis].set_segments(segments)
+
+            #labels at the very edge would stick out of the axes, where blitting does not redraw
+            inside = np.abs(positions) < 0.47 * span
+            values, positions = values[inside], positions[inside]
+            for label, value, position in zip(self.labels[axis], values, positions):
+                label.set_text(self.label_format.format(value + 0.0))
+                if axis == "x":
+                    label.set_x(position)
+                else:
+                    label.set_y(position)
+                label.set_visible(True)
+            for label in self.labels[axis][len(values):]:
+                label.set_visible(False)
+
+        return tuple(self.artists)
@@ -0,0 +1,70 @@
+import numpy as np
+
+"""Dense output: the state at any time from the stored integration steps
+Between two stored steps the motion is a cubic Hermite curve through both
+positions with both velocities as tangents (third order accurate), so the
+integrator can take big steps and keep only their endpoints, and animations
+evaluate exactly the frame times they need (e.g. 60 fps) one frame at a time."""
+
+def frame_times(start: float, end: float, frame_rate: float = 60):
+    """Times of the animation frames from start to end (s), the end always included"""
+    times = np.arange(start, end, 1 / frame_rate)
+    return np.append(times, end) if len(times) == 0 or times[-1] < end else times
+
+def hermite_step(s, p0, p1, m0, m1):
+    """Cubic Hermite curve of one step at fraction s (0..1) and its derivative d/ds
+    p0, p1 - positions at both ends, m0, m1 - tangents (velocity * step length)"""
+    s2, s3 = s * s, s * s * s
+    positions = (2 * s3 - 3 * s2 + 1) * p0 + (s3 - 2 * s2 + s) * m0 + (-2 * s3 + 3 * s2) * p1 + (s3 - s2) * m1
+    derivative = (6 * s2 - 6 * s) * (p0 - p1) + (3 * s2 - 4 * s + 1) * m0 + (3 * s2 - 2 * s) * m1
+    return positions, derivative
+
+def locate_crossing(p0, p1, m0, m1, iterations: int = 60):
+    """Fraction s (0..1) of a step where a coordinate's Hermite curve reaches zero, for p0 > 0 >= p1
+    (event location, e.g. ground impact). Bisection on scalars or arrays of steps"""
+    low = np.zeros(np.shape(p0))
+    high = np.ones(np.shape(p0))
+    for _ in range(iterations):
+        middle = 0.5 * (low + high)
+        above = hermite_step(middle, p0, p1, m0, m1)[0] > 0
+        low = np.where(above, middle, low)
+        high = np.where(above, high, middle)
+    return high
+
+class HermiteTrajectory:
+    def __init__(self, times, positions, velocities):
+        """times (steps,) increasing, positions and velocities (steps, ...) at those times
+        in matching units (e.g. m and m/s)"""
+        self.times = np.asarray(times, dtype=float)
+        self.positions = np.asarray(positions, dtype=float)
+        self.velocities = np.asarray(velocities, dtype=float)
+
+    @property
+    def start(self):
+        return self.times[0]
+
+    @property
+    def end(self):
+        return self.times[-1]
+
+    def __call__(self, time):
+        """(positions, velocities) at a time or an array of times (clamped to the stored range)"""
+        time = np.clip(np.asarray(time, dtype=float), self.start, self.end)
+        step = np.clip(np.searchsorted(self.times, time, side="right") - 1, 0, len(self.times) - 2)
+
+        t0, t1 = self.times[step], self.times[step + 1]
+        h = t1 - t0
+        #position inside the step, 0..1
+        s = np.divide(time - t0, h, out=np.zeros_like(h), where=h > 0)
+
+        shape = s.shape + (1,) * (self.positions.ndim - 1)
+        s, h = s.reshape(shape), h.reshape(shape)
+        p0, p1 = self.positions[step], self.positions[step + 1]
+        m0 = self.velocities[step] * h
+        m1 = self.velocities[step + 1] * h
+
+        positions, derivative = hermite_step(s, p0, p1, m0, m1)
+        #derivative of the curve, back to velocity units
+        velocities = np.divide(derivative, h, out=self.velocities[step].copy(), where=h > 0)
+
+        return positions, velocities
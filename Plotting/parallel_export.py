@@ -0,0 +1,134 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+
+"""Parallel export of matplotlib animations (GIF / MP4)
+Replaces ani.save(...) for scripts that animate with an update(frame) function:
+the frames are split into chunks rendered by a pool of worker processes, each
+drawing on its own Agg canvas, and the raw RGB buffers are passed to the encoder
+in frame order. For GIF the workers also reduce every frame to its 256 colour
+palette, the slowest part of GIF encoding. The workers are forked from the
+calling process, so they already hold the figure, its artists and the update
+function; nothing has to be pickled.
+Where fork is not available the frames are rendered one by one in this process.
+
+Preview mode (preview_every=n) renders every n-th frame at 1/n of the frame
+rate, same duration, n times faster."""
+
+#figure, update function and palette flag of the export in progress, inherited by the forked workers
+render_job = None
+
+def render_chunk(frames):
+    """Render frames to raw RGB bytes, or to (palette indices, palette) for GIF (in a worker, or in this process)"""
+    fig, update, palette = render_job
+    canvas = FigureCanvasAgg(fig)
+
+    #a FuncAnimation with blit=True marks its artists as animated, a plain draw would skip them
+    animated = [artist for artist in fig.findobj() if artist.get_animated()]
+    for artist in animated:
+        artist.set_animated(False)
+
+    images = []
+    try:
+        for frame in frames:
+            update(frame)
+            #an existing FuncAnimation on the figure must not start (and run its init_func) on this draw
+            with canvas.callbacks.blocked(signal="draw_event"):
+                canvas.draw()
+            rgb = np.asarray(canvas.buffer_rgba())[..., :3]
+            if palette:
+                image = Image.fromarray(rgb).convert("P", palette=Image.Palette.ADAPTIVE)
+                images.append((image.tobytes(), image.getpalette()))
+            else:
+                images.append(rgb.tobytes())
+    finally:
+        for artist in animated:
+            artist.set_animated(True)
+    return images
+
+def start_worker(init):
+    """Pool initializer: run the animation's init function once per worker"""
+    if init is not None:
+        init()
+
+def rendered_frames(frames: list, workers: int, chunk_frames: int, init):
+    """Generator of every rendered frame (see render_chunk), in order"""
+    chunks = [frames[start:start + chunk_frames] for start in range(0, len(frames), chunk_frames)]
+
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        start_worker(init)
+        for chunk in chunks:
+            yield from render_chunk(chunk)
+        return
+
+    with multiprocessing.get_context("fork").Pool(workers, initializer=start_worker, initargs=(init,)) as pool:
+        for images in pool.imap(render_chunk, chunks):
+            yield from images
+
+def export_animation(path: str, fig, update, frames, fps: float, dpi: float | None = None, init=None,
+                     workers: int | None = None, preview_every: int = 1, chunk_frames: int = 16):
+    """Render update(frame) for every frame on `workers` processes and encode the result
+    path - output file, .gif (Pillow) or .mp4 (ffmpeg)
+    frames - number of frames, or the sequence of values passed to update (as FuncAnimation)
+    dpi - render resolution, the figure's own dpi by default
+    init - optional function run before the first frame (FuncAnimation's init_func)
+    preview_every - only render every n-th frame (the frame rate is divided by n)"""
+    global render_job
+
+    frames = list(range(frames)) if isinstance(frames, int) else list(frames)
+    frames = frames[::preview_every]
+    fps = fps / preview_every
+    workers = workers or os.cpu_count()
+
+    original_dpi = fig.get_dpi()
+    original_canvas = fig.canvas
+    if dpi is not None:
+        fig.set_dpi(dpi)
+    width, height = (int(round(size)) for size in fig.get_size_inches() * fig.get_dpi())
+
+    match os.path.splitext(path)[1].lower():
+        case ".mp4":
+            writer = write_mp4
+        case ".gif":
+            writer = write_gif
+        case _:
+            print("Invalid file type. Defaulting to gif...")
+            writer = write_gif
+
+    render_job = (fig, update, writer is write_gif)
+    try:
+        writer(path, rendered_frames(frames, workers, chunk_frames, init), width, height, fps)
+    finally:
+        render_job = None
+        fig.set_canvas(original_canvas)
+        fig.set_dpi(original_dpi)
+
+def palette_image(width: int, height: int, indices: bytes, palette: list):
+    image = Image.frombytes("P", (width, height), indices)
+    image.putpalette(palette)
+    return image
+
+def write_gif(path: str, images, width: int, height: int, fps: float):
+    """Write palette frames (see render_chunk) with Pillow"""
+    frames = (palette_image(width, height, *image) for image in images)
+    first = next(frames)
+    first.save(path, save_all=True, append_images=frames, duration=1000 / fps, loop=0)
+
+def write_mp4(path: str, images, width: int, height: int, fps: float):
+    """Pipe the raw frames into ffmpeg (H.264, even frame size)"""
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is needed for .mp4 export")
+
+    command = ["ffmpeg", "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+               "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", path]
+    with subprocess.Popen(command, stdin=subprocess.PIPE) as encoder:
+        for image in images:
+            encoder.stdin.write(image)
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed with exit code {encoder.returncode}")
@@ -0,0 +1,74 @@
+import numpy as np
+from matplotlib.collections import LineCollection
+
+"""Fast plotting of long trajectories
+A screen cannot show more points than it has pixels, so every series is reduced
+with Largest-Triangle-Three-Buckets (LTTB) before drawing: the samples are cut
+into equal buckets and from each bucket the point forming the largest triangle
+with the previous pick and the next bucket's average is kept. Peaks, turning
+points and the overall shape survive, and drawing costs the same for a run of
+a thousand or a hundred million steps.
+
+Trajectories are curves (x(t), y(t)), so the buckets follow the sample order
+and the triangle areas are measured in the plotted x-y plane."""
+
+def lttb(points, max_points: int):
+    """Indices of at most max_points samples of a (n, 2) series, first and last always kept"""
+    points = np.asarray(points, dtype=float)
+    count = len(points)
+    if count <= max_points or max_points < 3:
+        return np.arange(count)
+
+    #bucket edges for the inner points, the first and last points are buckets of their own
+    edges = np.linspace(1, count - 1, max_points - 1).astype(int)
+    #average of every bucket, used as the third corner by the bucket before it
+    sums = np.add.reduceat(points[1:count - 1], edges[:-1] - 1)
+    averages = sums / np.diff(edges)[:, None]
+    averages = np.vstack([averages[1:], points[-1]])
+
+    indices = np.empty(max_points, dtype=int)
+    indices[0], indices[-1] = 0, count - 1
+    previous = points[0]
+
+    for bucket in range(max_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        candidates = points[start:stop]
+        average = averages[bucket]
+
+        # twice the triangle area |(p - a) x (c - a)|
+        area = np.abs((candidates[:, 0] - previous[0]) * (average[1] - previous[1])
+                      - (candidates[:, 1] - previous[1]) * (average[0] - previous[0]))
+        chosen = start + int(np.argmax(area))
+
+        indices[bucket + 1] = chosen
+        previous = points[chosen]
+
+    return indices
+
+def downsample(points, max_points: int = 4000):
+    """Shape preserving reduction of a (n, 2) series to at most max_points rows
+    Non finite rows (e.g. bodies that merged) are left out"""
+    points = np.asarray(points, dtype=float)[:, :2]
+    points = points[np.isfinite(points).all(axis=1)]
+    return points[lttb(points, max_points)]
+
+def plot_trajectories(ax, trajectories, labels=None, max_points: int = 4000, collection_from: int = 10):
+    """Draw (n, 2 or 3) trajectories on ax in the x-y plane, each downsampled to max_points
+    From collection_from trajectories on they are drawn as one LineCollection (one artist)
+    instead of a line each, and only the first few are labelled"""
+    lines = [downsample(trajectory, max_points) for trajectory in trajectories]
+    labels = list(labels) if labels is not None else [None] * len(lines)
+
+    if len(lines) < collection_from:
+        for line, label in zip(lines, labels):
+            ax.plot(line[:, 0], line[:, 1], label=label)
+        return
+
+    colors = [f"C{index % 10}" for index in range(len(lines))]
+    ax.add_collection(LineCollection(lines, colors=colors, linewidths=1))
+    ax.autoscale_view()
+
+    #legend entries for the first colours only
+    for index, label in enumerate(labels[:collection_from]):
+        if label is not None:
+            ax.plot([], [], color=colors[index], label=label)
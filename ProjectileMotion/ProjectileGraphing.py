@@ -1,3 +1,5 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import style
@@ -8,6 +10,10 @@ from matplotlib.animation import FuncAnimation
 2. graph the velocity
 """
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Plotting"))
+from parallel_export import export_animation
+from follow_camera import FollowCamera
+
 """Add the simulation data:"""
 from ProjectileCompute import Projectile
 vel = 100
@@ -34,7 +40,10 @@ ax_traj.set_title("Projectile Trajectory", fontdict={"fontsize":15})
 ax_traj.set_xlabel("Horizontal Distance (m)", fontdict={"fontsize":11})
 ax_traj.set_ylabel("Height (m)", fontdict={"fontsize":11})
 
-ax_traj.grid(alpha = 0.1)
+"""the camera follows the projectile, so the limits (and the blitted background) never change"""
+desired_limit = 100
+camera = FollowCamera(ax_traj, 2 * desired_limit, 2 * desired_limit, spacing = 50, grid = {"color": "white", "alpha": 0.1})
+
 """add the trajectory line"""
 line, = ax_traj.plot([], [], color = "red", label = "trajectory", linewidth = 2)
 
@@ -42,9 +51,10 @@ line, = ax_traj.plot([], [], color = "red", label = "trajectory", linewidth = 2)
 l_length = proj.max_altitude() * (1/np.sin(angle/180.0 * np.pi))
 l_height = np.sin(angle/180 * np.pi) * l_length
 l_length = np.cos(angle/180 * np.pi) * l_length
-ax_traj.plot([0,l_length], [0,l_height], linestyle = "--", color = "white", label = "launch angle")
+angle_line, = ax_traj.plot([0,l_length], [0,l_height], linestyle = "--", color = "white", label = "launch angle")
 #this too:
-ax_traj.plot([-l_length, proj.range() + l_length], [0, 0], linestyle = "--", color = "White", alpha = 0.2)
+ground_line, = ax_traj.plot([-l_length, proj.range() + l_length], [0, 0], linestyle = "--", color = "White", alpha = 0.2)
+camera.add(line, angle_line, ground_line)
 
 ax_traj.legend()
 
@@ -65,11 +75,8 @@ vel_fill = ax_vel.fill_between([], [], [], color = vel_color, alpha = 0.5, hatch
 ax_vel.legend()
 
 """create the animation data"""
-desired_limit = 100
-
 def init():
-    ax_traj.set_xlim(0, max(x_data) + desired_limit)
-    ax_traj.set_ylim(0, max(y_data) + desired_limit)
+    camera_artists = camera.move_to(x_data[0], y_data[0])
     ax_vel.set_xlim(0, proj.flight_time)
     ax_vel.set_ylim(-1 * proj.v_y_launch, proj.v_y_launch)
 
@@ -78,7 +85,7 @@ def init():
     vel_0.set_data([], [])
     vel_fill.set_data([], [], [])
 
-    return (line, vel_line, vel_0, vel_fill)
+    return (line, angle_line, ground_line, vel_line, vel_0, vel_fill) + camera_artists
 
 def update(frame):
     x_values = x_data[:frame]
@@ -92,17 +99,16 @@ def update(frame):
     vel_0.set_data(vel_x_values, v_0_values)
     vel_fill.set_data(vel_x_values, v_y_values, v_0_values)
 
-    # update limits to follow projectile
-    x_current = x_data[frame]
-    y_current = y_data[frame]
-    ax_traj.set_xlim(x_current - desired_limit, x_current + desired_limit)
-    ax_traj.set_ylim(y_current - desired_limit, y_current + desired_limit)
+    # move the camera to follow projectile
+    camera_artists = camera.move_to(x_data[frame], y_data[frame])
 
-    return (line, vel_line, vel_0, vel_fill)
+    return (line, angle_line, ground_line, vel_line, vel_0, vel_fill) + camera_artists
 
 """create the animation"""
-ani1 = FuncAnimation(fig, func = update, frames = num_frames, init_func = init, interval = 30, blit = False)
-#ani1.save("ProjectileMotion/Projectile_Animated.gif")
+ani1 = FuncAnimation(fig, func = update, frames = num_frames, init_func = init, interval = 30, blit = True)
+#save with --save (rendered on every core)
+if "--save" in sys.argv:
+    export_animation("ProjectileMotion/Projectile_Animated.gif", fig, update, num_frames, fps = 1000 / 30, init = init)
 
 plt.show()
 plt.close()
@@ -0,0 +1,147 @@
+import hashlib
+import inspect
+import os
+import numpy as np
+
+"""Content addressed cache for deterministic simulation results
+A result is stored as one .npz file named after the hash of everything that
+determines it: initial conditions, parameters, integrator and the source code
+of the simulation modules. Re-running a figure script with unchanged inputs
+reloads the arrays instead of simulating again; any change to the inputs or to
+the simulation code gives a new key, so stale results are never returned.
+
+The cache directory is bounded in size: when it grows past max_bytes the least
+recently used results are deleted (a hit refreshes the file's modification time).
+
+Opt-in from the scripts, e.g. python Gravity_celestial_bodies/Polaris_system.py --cache"""
+
+def hash_value(digest, value):
+    """Feed a value into the hash with a type tag, so e.g. 1 and "1" differ"""
+    match value:
+        case np.ndarray():
+            value = np.ascontiguousarray(value)
+            digest.update(f"array{value.dtype.str}{value.shape}".encode())
+            digest.update(value.tobytes())
+        case dict():
+            digest.update(b"dict")
+            for key in sorted(value):
+                hash_value(digest, key)
+                hash_value(digest, value[key])
+        case list() | tuple():
+            digest.update(f"sequence{len(value)}".encode())
+            for item in value:
+                hash_value(digest, item)
+        case np.generic():
+            hash_value(digest, value.item())
+        case _:
+            digest.update(f"{type(value).__name__}:{value!r}".encode())
+
+def cache_key(*parts):
+    """Hex key of the given inputs (arrays, numbers, strings, dicts, lists...)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        hash_value(digest, part)
+    return digest.hexdigest()
+
+#modules below this folder are part of the simulation code (others are installed libraries)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def repo_module(module):
+    """True for modules with a source file inside the repository (not a virtual environment in it)"""
+    path = getattr(module, "__file__", None)
+    if not path:
+        return False
+    path = os.path.abspath(path)
+    return os.path.commonpath([path, REPO_ROOT]) == REPO_ROOT and "site-packages" not in path.split(os.sep)
+
+def module_sources(module, sources: dict):
+    """Source files of a module and of every repository module it uses, in any folder"""
+    path = inspect.getsourcefile(module)
+    if path is None:
+        return
+    #folders are reached through different sys.path entries (e.g. "../Plotting")
+    path = os.path.abspath(path)
+    if path in sources:
+        return
+    with open(path, "rb") as file:
+        sources[path] = file.read()
+
+    for value in vars(module).values():
+        used = inspect.getmodule(value)
+        if used is not None and used is not module and repo_module(used):
+            module_sources(used, sources)
+
+def write_npz(path: str, arrays: dict):
+    """Save named arrays to an .npz file atomically: they are written to a temporary file,
+    flushed to disk and only then renamed over `path`, so an interrupted write never leaves
+    a truncated file (checkpoints, cached results)"""
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+def code_version(*objects):
+    """Hash of the source code behind the given modules, classes or functions
+    (following their imports of other repository modules), part of every cache key"""
+    sources = {}
+    for obj in objects:
+        module_sources(obj if inspect.ismodule(obj) else inspect.getmodule(obj), sources)
+    return cache_key([sources[path] for path in sorted(sources)])
+
+class ResultCache:
+    def __init__(self, directory: str = ".simulation_cache", max_bytes: int = 2 ** 30):
+        """directory - where results are stored (created if needed)
+        max_bytes - size limit of the directory, least recently used results are evicted past it"""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key: str):
+        """Path of the stored result or None, a hit marks the result as recently used"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def put(self, key: str, write):
+        """Store a result with write(path) (e.g. a save_checkpoint method), then evict"""
+        write(self.path(key))
+        self.evict()
+
+    def get_arrays(self, key: str):
+        """Stored arrays as a dict or None"""
+        path = self.get(key)
+        if path is None:
+            return None
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def put_arrays(self, key: str, **arrays):
+        """Store named arrays (see write_npz)"""
+        self.put(key, lambda path: write_npz(path, arrays))
+
+    def evict(self):
+        """Delete the least recently used results until the directory fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                status = os.stat(os.path.join(self.directory, name))
+                entries.append((status.st_mtime, status.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                os.remove(os.path.join(self.directory, name))